@@ -5,15 +5,17 @@ Provides endpoints for current day, tomorrow and custom dates.
 """
 
 import os
+import json
 import math
+import hashlib
 import logging
-from datetime import date, datetime, timedelta
-from typing import List, Optional, Dict, Any
+from datetime import date, datetime, timedelta, timezone
+from typing import List, Optional, Dict, Any, Set
 import traceback
+from zoneinfo import ZoneInfo
 
-import pytz
-from fastapi import FastAPI, Query, HTTPException, Request
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI, Query, HTTPException, Request, Response
+from fastapi.responses import JSONResponse, ORJSONResponse
 from fastapi.exceptions import RequestValidationError
 from pydantic import ValidationError
 import uvicorn
@@ -36,6 +38,12 @@ try:
 except Exception as e:
     raise RuntimeError(f"Could not import ha_entsoe.py: {e}")
 
+# Optional: orjson for faster response serialization
+try:
+    import orjson
+except ImportError:
+    orjson = None  # type: ignore[assignment]
+
 try:
     from dotenv import load_dotenv
 
@@ -73,13 +81,14 @@ DEFAULT_ZONE = os.getenv("ZONE_EIC", EIC_OPTIONS["Netherlands"])
 DEFAULT_TIMEZONE = "Europe/Amsterdam"
 
 # Timezone configuration - ALWAYS use Dutch time
-NL_TZ = pytz.timezone("Europe/Amsterdam")
+NL_TZ = ZoneInfo(DEFAULT_TIMEZONE)
 
 # ============================================================================
 # FASTAPI APP
 # ============================================================================
 
 app = FastAPI(
+    default_response_class=ORJSONResponse if orjson else JSONResponse,
     title="ENTSO‑E Home Automation API",
     description=(
         "Small wrapper for ENTSO‑E data (prices, load, production, net position) "
@@ -355,6 +364,44 @@ def create_metadata(
     return metadata
 
 
+def data_etag(*parts: Any) -> str:
+    """
+    Build a weak ETag from the data behind a response.
+
+    Metadata (timestamps, execution time) is not part of the tag, so
+    responses built from the same rows share an ETag.
+
+    Args:
+        *parts: JSON-serialisable values that identify the response data
+
+    Returns:
+        Weak ETag header value
+    """
+    payload = json.dumps(parts, sort_keys=True, separators=(",", ":"), default=str)
+    return f'W/"{hashlib.blake2b(payload.encode(), digest_size=16).hexdigest()}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """
+    Check an If-None-Match header against an ETag (weak comparison).
+
+    Args:
+        if_none_match: Raw If-None-Match header value, if any
+        etag: Current ETag
+
+    Returns:
+        True if the client already has this representation
+    """
+    if not if_none_match:
+        return False
+    opaque = etag.removeprefix("W/")
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*" or candidate.removeprefix("W/") == opaque:
+            return True
+    return False
+
+
 # ============================================================================
 # STATISTICS HELPERS
 # ============================================================================
@@ -437,20 +484,58 @@ def get_rank_icon(rank: int) -> str:
 # ============================================================================
 
 
+def parse_hour_local(hour_local: str) -> datetime:
+    """
+    Parse a naive slot timestamp "YYYY-MM-DD HH:MM".
+
+    datetime.fromisoformat is a C fast path, much cheaper than strptime;
+    the length check keeps the accepted format as strict as before.
+
+    Raises:
+        ValueError: If the string is not a "YYYY-MM-DD HH:MM" timestamp
+    """
+    if len(hour_local) != 16:
+        raise ValueError(f"Invalid slot timestamp '{hour_local}'")
+    return datetime.fromisoformat(hour_local)
+
+
+def slot_end_utc(hour_local: str, resolution_minutes: int, fold: int = 0) -> datetime:
+    """
+    End of a slot as an aware UTC datetime.
+
+    Aware datetimes sharing a tzinfo compare and add on the wall clock, so
+    the end is computed in UTC. On the autumn DST day the 02:00 hour occurs
+    twice; pass fold=1 for its second occurrence.
+    """
+    start = parse_hour_local(hour_local).replace(tzinfo=NL_TZ, fold=fold)
+    return start.astimezone(timezone.utc) + timedelta(minutes=resolution_minutes)
+
+
+def repeated_positions(slots: List[Dict]) -> Set[int]:
+    """Positions whose hour_local already occurred earlier that day (fold=1)."""
+    seen: Set[str] = set()
+    repeated: Set[int] = set()
+    for slot in sorted(slots, key=lambda s: s["position"]):
+        if slot["hour_local"] in seen:
+            repeated.add(slot["position"])
+        seen.add(slot["hour_local"])
+    return repeated
+
+
 def belongs_to_today(hour_local: str) -> bool:
     """
     Check if a slot belongs to today (not after midnight).
     Slots between 00:00 - 06:00 we consider as "early tomorrow".
     """
     try:
-        dt = datetime.strptime(hour_local, "%Y-%m-%d %H:%M")
+        dt = parse_hour_local(hour_local)
         return dt.hour >= 6
     except Exception:
         return True
 
 
 def is_past_slot(
-    hour_local: str, slot_date: date, resolution_minutes: int = 60
+    hour_local: str, slot_date: date, resolution_minutes: int = 60, fold: int = 0
 ) -> bool:
     """
     Check if an INDIVIDUAL slot has completely passed (DUTCH TIME).
@@ -461,6 +546,7 @@ def is_past_slot(
         hour_local: Timestamp string "YYYY-MM-DD HH:MM"
         slot_date: Date of the slot
         resolution_minutes: Resolution in minutes (60 or 15)
+        fold: 1 for the second occurrence of a repeated hour (autumn DST)
 
     Returns:
         True if slot is completely past
@@ -479,18 +565,16 @@ def is_past_slot(
 
     # For today: check if the slot is COMPLETELY past
     try:
-        dt = datetime.strptime(hour_local, "%Y-%m-%d %H:%M")
-        # Make timezone-aware with Dutch time
-        dt = NL_TZ.localize(dt)
-        end_dt = dt + timedelta(minutes=resolution_minutes)
+        end_dt = slot_end_utc(hour_local, resolution_minutes, fold)
 
-        # Slot is only past when the end time is PAST
+        # Slot is only past when the end time is PAST (compared in UTC)
         is_past = now > end_dt
 
         if LOG_LEVEL == "DEBUG":
             logger.debug(
                 f"      Individual slot {hour_local.split()[1]}: "
-                f"end={end_dt.strftime('%H:%M')}, now={now.strftime('%H:%M')}, "
+                f"end={end_dt.astimezone(NL_TZ).strftime('%H:%M')}, "
+                f"now={now.strftime('%H:%M')}, "
                 f"is_past={is_past}"
             )
 
@@ -529,8 +613,8 @@ def detect_resolution(slots: List[Dict]) -> int:
 
     # Fallback: calculate from time between first two slots
     try:
-        t1 = datetime.strptime(slots[0]["hour_local"], "%Y-%m-%d %H:%M")
-        t2 = datetime.strptime(slots[1]["hour_local"], "%Y-%m-%d %H:%M")
+        t1 = parse_hour_local(slots[0]["hour_local"])
+        t2 = parse_hour_local(slots[1]["hour_local"])
         diff_min = int((t2 - t1).total_seconds() / 60)
 
         if diff_min == 15:
@@ -556,8 +640,8 @@ def format_time_range(start: str, end: str, resolution_minutes: int = 60) -> str
         Formatted string "HH:MM - HH:MM"
     """
     try:
-        start_dt = datetime.strptime(start, "%Y-%m-%d %H:%M")
-        end_dt = datetime.strptime(end, "%Y-%m-%d %H:%M")
+        start_dt = parse_hour_local(start)
+        end_dt = parse_hour_local(end)
 
         # IMPORTANT: end is the START of the last slot
         # So we need to ADD resolution_minutes for the real end time
@@ -809,26 +893,26 @@ def find_most_expensive_hour(
     else:
         # PT15M: find most expensive consecutive 60 minutes (4 slots)
         sorted_slots = sorted(future_slots, key=lambda s: s["position"])
+        positions = [s["position"] for s in sorted_slots]
+        prices = [s["ct_per_kwh"] for s in sorted_slots]
 
         window_size = 4
         max_avg = -float("inf")
         best_window = None
 
-        for i in range(len(sorted_slots) - window_size + 1):
-            window = sorted_slots[i : i + window_size]
-
-            # Check if slots are consecutive
-            is_consecutive = True
-            for j in range(len(window) - 1):
-                if window[j + 1]["position"] - window[j]["position"] > 1:
-                    is_consecutive = False
-                    break
+        # Running count of position gaps, so each window checks
+        # consecutiveness in O(1) instead of re-walking its slots
+        gaps_upto = [0]
+        for prev_pos, next_pos in zip(positions, positions[1:]):
+            gaps_upto.append(gaps_upto[-1] + (next_pos - prev_pos > 1))
 
-            if is_consecutive:
-                avg_price = sum(s["ct_per_kwh"] for s in window) / len(window)
-                if avg_price > max_avg:
-                    max_avg = avg_price
-                    best_window = window
+        for i in range(len(sorted_slots) - window_size + 1):
+            if gaps_upto[i + window_size - 1] != gaps_upto[i]:
+                continue
+            avg_price = sum(prices[i : i + window_size]) / window_size
+            if avg_price > max_avg:
+                max_avg = avg_price
+                best_window = sorted_slots[i : i + window_size]
 
         if best_window:
             prices = [s["ct_per_kwh"] for s in best_window]
@@ -892,6 +976,8 @@ def process_day_data(
     all_slots = day_data.get("cheapest_slots", [])
     all_day_slots = day_data.get("all_slots", [])
     avg_price = day_data.get("average_ct_per_kwh", 0)
+    # Tweede doorgang van het dubbele uur (wintertijd) krijgt fold=1
+    repeated = repeated_positions(all_day_slots or all_slots)
 
     logger.info(f"🔄 Processing {len(all_slots)} slots for {slot_date.isoformat()}")
 
@@ -1003,15 +1089,12 @@ def process_day_data(
         is_future = True  # Default: toekomstig
 
         try:
-            # Parse laatste slot tijd
-            last_slot_time = datetime.strptime(
-                last_slot["hour_local"], "%Y-%m-%d %H:%M"
+            # Bereken wanneer het laatste slot eindigt (in UTC, DST-veilig)
+            last_slot_end = slot_end_utc(
+                last_slot["hour_local"],
+                resolution_minutes,
+                int(last_slot["position"] in repeated),
             )
-            # Maak timezone-aware met NEDERLANDSE TIJD
-            last_slot_time = NL_TZ.localize(last_slot_time)
-
-            # Bereken wanneer het laatste slot eindigt
-            last_slot_end = last_slot_time + timedelta(minutes=resolution_minutes)
 
             # Blok is verstreken als huidige tijd VOORBIJ de eindtijd is
             is_past_block = now > last_slot_end
@@ -1022,15 +1105,16 @@ def process_day_data(
                 time_range_display = format_time_range(
                     group["start"], group["end"], resolution_minutes
                 )
+                end_local = last_slot_end.astimezone(NL_TZ)
                 logger.debug(
                     f"   🔍 Block {rank} analysis:\n"
                     f"      Time range: {time_range_display}\n"
                     f"      First slot: {first_slot['hour_local']}\n"
                     f"      Last slot:  {last_slot['hour_local']}\n"
-                    f"      Last slot end: {last_slot_end.strftime('%Y-%m-%d %H:%M')}\n"
+                    f"      Last slot end: {end_local.strftime('%Y-%m-%d %H:%M')}\n"
                     f"      Current time:  {now.strftime('%Y-%m-%d %H:%M')}\n"
                     f"      Comparison: {now.strftime('%H:%M')} > "
-                    f"{last_slot_end.strftime('%H:%M')} = {is_past_block}\n"
+                    f"{end_local.strftime('%H:%M')} = {is_past_block}\n"
                     f"      ➜ is_past={is_past_block}, is_future={is_future}"
                 )
 
@@ -1068,7 +1152,10 @@ def process_day_data(
                     "time": s["hour_local"].split(" ")[1],
                     "price": round(s["ct_per_kwh"], 3),
                     "is_past": is_past_slot(
-                        s["hour_local"], slot_date, resolution_minutes
+                        s["hour_local"],
+                        slot_date,
+                        resolution_minutes,
+                        int(s["position"] in repeated),
                     ),
                 }
                 for s in group["slots"]
@@ -1095,20 +1182,20 @@ def process_day_data(
             try:
                 # Parse laatste slot van het duurste blok
                 last_expensive = expensive_hour["slots"][-1]
-                last_time = datetime.strptime(
-                    last_expensive["hour_local"], "%Y-%m-%d %H:%M"
+                last_end = slot_end_utc(
+                    last_expensive["hour_local"],
+                    resolution_minutes,
+                    int(last_expensive["position"] in repeated),
                 )
-                # NEDERLANDSE TIJD
-                last_time = NL_TZ.localize(last_time)
-                last_end = last_time + timedelta(minutes=resolution_minutes)
 
                 is_future_avoid = now <= last_end
 
                 if LOG_LEVEL == "DEBUG":
+                    end_local = last_end.astimezone(NL_TZ)
                     logger.debug(
                         f"   🔍 Expensive hour analysis:\n"
                         f"      Time: {expensive_hour['time_range']}\n"
-                        f"      Last slot end: {last_end.strftime('%H:%M')}\n"
+                        f"      Last slot end: {end_local.strftime('%H:%M')}\n"
                         f"      Current: {now.strftime('%H:%M')}\n"
                         f"      is_future: {is_future_avoid}"
                     )
@@ -1132,7 +1219,10 @@ def process_day_data(
                         "time": s["hour_local"].split(" ")[1],
                         "price": round(s["ct_per_kwh"], 3),
                         "is_past": is_past_slot(
-                            s["hour_local"], slot_date, resolution_minutes
+                            s["hour_local"],
+                            slot_date,
+                            resolution_minutes,
+                            int(s["position"] in repeated),
                         ),
                     }
                     for s in expensive_hour["slots"]
@@ -1247,6 +1337,8 @@ def system_health():
     summary="Dag‑ahead prijzen (ENTSO‑E A44)",
 )
 def energy_prices_dayahead(
+    request: Request,
+    response: Response,
     date_str: Optional[str] = Query(
         None,
         alias="date",
@@ -1272,6 +1364,12 @@ def energy_prices_dayahead(
 
         rows = entsoe.get_day_ahead_prices(target_date, zone)
 
+        # Ongewijzigde data: 304 zonder body (HA pollt elke minuut)
+        etag = data_etag(target_date.isoformat(), zone, rows)
+        if etag_matches(request.headers.get("if-none-match"), etag):
+            return Response(status_code=304, headers={"ETag": etag})
+        response.headers["ETag"] = etag
+
         # Detecteer resolutie
         resolution = detect_resolution(rows) if rows else 60
 
@@ -1431,8 +1529,14 @@ def energy_prices_cheapest_basic(
 
         # Converteer naar output format
         result_hours = []
+        repeated = repeated_positions(all_prices)
         for hour in cheapest_hours:
-            is_past = is_past_slot(hour["hour_local"], target_date, resolution_minutes)
+            is_past = is_past_slot(
+                hour["hour_local"],
+                target_date,
+                resolution_minutes,
+                int(hour["position"] in repeated),
+            )
 
             result_hours.append(
                 {
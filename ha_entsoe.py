@@ -18,6 +18,7 @@ ENTSO-E integratie met:
   BACKOFF_BASE=1.7
   BACKOFF_CAP_SECONDS=30
   HTTP_READ_TIMEOUT=45
+  MAX_PARALLEL_REQUESTS=4
 
   CACHE_DIR=/app/cache
   SAVE_RAW=1
@@ -40,19 +41,48 @@ ENTSO-E integratie met:
 """
 
 import os
+import re
 import sys
+import atexit
+import argparse
 import json
 import time
+import hashlib
 import math
 import random
 import logging
+import functools
+import threading
+from collections import OrderedDict
+from operator import itemgetter
+from email.utils import parsedate_to_datetime
 from pathlib import Path
-from typing import Dict, List, Tuple, Optional, Iterable
+from typing import Dict, List, Tuple, Optional, Iterable, FrozenSet
 from datetime import datetime, date, timedelta, timezone
-from xml.etree import ElementTree as ET
 
-import requests
-from dateutil import tz, parser as dtparser
+from dateutil import tz
+
+# requests, dateutil.parser en concurrent.futures worden pas geïmporteerd
+# waar ze nodig zijn: korte CLI-aanroepen (of een cache-hit) starten zo sneller.
+
+# Snelle XML parser (optioneel): lxml (libxml2), anders stdlib ElementTree.
+# Beide ondersteunen de {*}-wildcards die hieronder gebruikt worden.
+try:
+    from lxml import etree as ET
+
+    _XMLSyntaxError = ET.XMLSyntaxError
+    HAVE_LXML = True
+except ImportError:
+    from xml.etree import ElementTree as ET  # type: ignore[no-redef]
+
+    _XMLSyntaxError = ET.ParseError  # type: ignore[misc]
+    HAVE_LXML = False
+
+# Snelle JSON encoder (optioneel)
+try:
+    import orjson
+except ImportError:
+    orjson = None  # type: ignore[assignment]
 
 # .env laden
 try:
@@ -107,12 +137,26 @@ API_ENDPOINT = "https://web-api.tp.entsoe.eu/api"
 
 ZONE_EIC_DEFAULT = getenv_str("ZONE_EIC", "10YNL----------L")
 TIME_ZONE_NAME = getenv_str("TIME_ZONE", "Europe/Amsterdam")
-TZ_LOCAL = tz.gettz(TIME_ZONE_NAME)
+
+
+def _load_tz(name: str):
+    # zoneinfo (stdlib, C) is ~20x sneller in astimezone() dan dateutil;
+    # dateutil blijft het vangnet als de tz-database ontbreekt (Windows)
+    try:
+        from zoneinfo import ZoneInfo
+
+        return ZoneInfo(name)
+    except Exception:
+        return tz.gettz(name)
+
+
+TZ_LOCAL = _load_tz(TIME_ZONE_NAME)
 
 MAX_RETRIES = getenv_int("MAX_RETRIES", 4)
 BACKOFF_BASE = getenv_float("BACKOFF_BASE", 1.7)
 BACKOFF_CAP_SECONDS = getenv_float("BACKOFF_CAP_SECONDS", 30.0)
 HTTP_READ_TIMEOUT = getenv_int("HTTP_READ_TIMEOUT", 45)
+MAX_PARALLEL_REQUESTS = getenv_int("MAX_PARALLEL_REQUESTS", 4)
 
 # Cache + opslag
 CACHE_DIR = Path(getenv_str("CACHE_DIR", "./cache"))
@@ -224,20 +268,50 @@ def dt_local(d: date, h: int = 0, m: int = 0) -> datetime:
 
 
 def fmt_period(dt_: datetime) -> str:
-    return dt_.strftime("%Y%m%d%H%M")
+    # f-string i.p.v. strftime: geen locale/tz-afhandeling nodig
+    return (
+        f"{dt_.year:04d}{dt_.month:02d}{dt_.day:02d}{dt_.hour:02d}{dt_.minute:02d}"
+    )
 
 
+def fmt_hour_local(dt_: datetime) -> str:
+    # "YYYY-MM-DD HH:MM" van een (al lokale) timestamp; zelfde truc als fmt_period
+    return (
+        f"{dt_.year:04d}-{dt_.month:02d}-{dt_.day:02d} {dt_.hour:02d}:{dt_.minute:02d}"
+    )
+
+
+@functools.lru_cache(maxsize=64)
 def local_span_day(d: date) -> Tuple[datetime, datetime]:
     return dt_local(d, 0, 0), dt_local(d, 23, 0)
 
 
+# periodStart/periodEnd per dag; wijzigt niet, dus één keer formatteren
+@functools.lru_cache(maxsize=64)
+def _period_span(d: date) -> Tuple[str, str]:
+    start, end = local_span_day(d)
+    return fmt_period(start), fmt_period(end)
+
+
+# Alle documenten van een dag delen dezelfde start-tijden; datetimes zijn
+# immutable, dus het resultaat kan veilig gedeeld worden
+@functools.lru_cache(maxsize=256)
 def parse_iso_dt(s: str) -> datetime:
-    dt = dtparser.isoparse(s)
+    # ENTSO-E levert "2023-10-28T00:00Z"; fromisoformat (C) kent "Z" pas vanaf
+    # Python 3.11, dus zelf omzetten. Andere varianten gaan via dateutil.
+    try:
+        dt = datetime.fromisoformat(s[:-1] + "+00:00" if s[-1:] == "Z" else s)
+    except ValueError:
+        from dateutil import parser as dtparser
+
+        dt = dtparser.isoparse(s)
     if dt.tzinfo is None:
         dt = dt.replace(tzinfo=timezone.utc)
     return dt
 
 
+# Slechts een handvol resoluties (PT15M/PT30M/PT60M); één keer uitrekenen
+@functools.lru_cache(maxsize=32)
 def resolve_resolution_to_timedelta(res_text: Optional[str]) -> timedelta:
     if not res_text:
         return timedelta(hours=1)
@@ -254,17 +328,51 @@ def resolve_resolution_to_timedelta(res_text: Optional[str]) -> timedelta:
 
 
 # XML parse helpers
+_XML_PARSER_LOCAL = threading.local()
+
+
+def _xml_parser():
+    # lxml-parsers zijn niet thread-safe: één hergebruikte parser per thread.
+    # Witruimte-nodes weglaten scheelt nodes bij elke iter(); geen entities/IDs.
+    if not HAVE_LXML:
+        return None
+    parser = getattr(_XML_PARSER_LOCAL, "parser", None)
+    if parser is None:
+        parser = ET.XMLParser(
+            remove_blank_text=True, collect_ids=False, resolve_entities=False
+        )
+        _XML_PARSER_LOCAL.parser = parser
+    return parser
+
+
 def parse_xml(xml_text: str) -> ET.Element:
+    # lxml weigert str met encoding-declaratie; bytes werken in beide parsers
+    data = xml_text.encode("utf-8") if isinstance(xml_text, str) else xml_text
     try:
-        return ET.fromstring(xml_text)
-    except ET.ParseError as e:
+        return ET.fromstring(data, _xml_parser())
+    except _XMLSyntaxError as e:
         raise EntsoeParseError(f"XML parse error: {e}")
 
 
+def _error_text(root: ET.Element) -> Optional[str]:
+    # Eén walk i.p.v. twee {*}-zoekacties; Reason/text gaat voor Message
+    message = None
+    for el in root.iter():
+        tag = el.tag
+        if el is root or not isinstance(tag, str):  # lxml: comments/PI's
+            continue
+        local = tag[tag.rfind("}") + 1 :]
+        if local == "text" and el.text:
+            return el.text
+        if local == "Message" and message is None:
+            message = el.text
+    return message
+
+
 def extract_entsoe_error(xml_text: str) -> Optional[str]:
     try:
-        root = ET.fromstring(xml_text)
-        msg = root.findtext(".//{*}text") or root.findtext(".//{*}Message")
+        root = parse_xml(xml_text)
+        msg = _error_text(root)
         if msg:
             return msg.strip()
     except Exception:
@@ -272,10 +380,56 @@ def extract_entsoe_error(xml_text: str) -> Optional[str]:
     return None
 
 
+def _xml_ns(el: ET.Element) -> str:
+    # "{urn:...}TimeSeries" -> "{urn:...}"; zonder namespace -> ""
+    tag = el.tag
+    return tag[: tag.index("}") + 1] if tag[:1] == "{" else ""
+
+
+class _XmlTags:
+    __slots__ = (
+        "timeseries",
+        "period",
+        "time_interval",
+        "start",
+        "resolution",
+        "point",
+        "position",
+        "price",
+        "quantity",
+        "production_type",
+        "psr_type",
+    )
+
+    def __init__(self, ns: str):
+        self.timeseries = f"{ns}TimeSeries"
+        self.period = f"{ns}Period"
+        self.time_interval = f"{ns}timeInterval"
+        self.start = f"{ns}start"
+        self.resolution = f"{ns}resolution"
+        self.point = f"{ns}Point"
+        self.position = f"{ns}position"
+        self.price = f"{ns}price.amount"
+        self.quantity = f"{ns}quantity"
+        self.production_type = f"{ns}productionType"
+        self.psr_type = f"{ns}psrType"
+
+
+@functools.lru_cache(maxsize=16)
+def _xml_tags(ns: str) -> _XmlTags:
+    return _XmlTags(ns)
+
+
+def _first_text(el: ET.Element, tag: str) -> Optional[str]:
+    for x in el.iter(tag):
+        return x.text
+    return None
+
+
 def pick_timeseries(root: ET.Element) -> List[ET.Element]:
-    ts = root.findall(".//{*}TimeSeries")
+    ts = list(root.iter(_xml_tags(_xml_ns(root)).timeseries))
     if not ts:
-        err = root.findtext(".//{*}text") or root.findtext(".//{*}Message")
+        err = _error_text(root)
         if err:
             raise EntsoeServerError(
                 f"ENTSO-E error: {err}", status=502, details={"entsoe_message": err}
@@ -286,7 +440,8 @@ def pick_timeseries(root: ET.Element) -> List[ET.Element]:
 
 # Tijd-as extractors
 def _safe_float(txt: Optional[str]) -> Optional[float]:
-    if txt is None:
+    # None en "" (lege elementen) zonder exception afhandelen
+    if not txt:
         return None
     try:
         return float(txt)
@@ -294,96 +449,126 @@ def _safe_float(txt: Optional[str]) -> Optional[float]:
         return None
 
 
+# Binnen 25 uur valt hooguit één DST-overgang; zonder overgang mag lokaal
+# gewoon opgeteld worden i.p.v. per punt astimezone() te doen
+_DST_SAFE_SPAN = timedelta(hours=25)
+
+
+def _append_points(
+    items: List[Dict],
+    container: ET.Element,
+    start_text: Optional[str],
+    res_text: Optional[str],
+    d: date,
+    local_tz,
+    q: _XmlTags,
+) -> None:
+    # Geïnterneerd: alle rijen (ook uit andere documenten) delen één string
+    res = sys.intern(res_text or "PT60M")
+    res_td = resolve_resolution_to_timedelta(res)
+    start_dt_utc = (
+        parse_iso_dt(start_text)
+        if start_text
+        else datetime(d.year, d.month, d.day, 0, 0, tzinfo=timezone.utc)
+    )
+    start_local = start_dt_utc.astimezone(local_tz)
+    fixed_offset = (
+        start_local.utcoffset()
+        == (start_dt_utc + _DST_SAFE_SPAN).astimezone(local_tz).utcoffset()
+    )
+    pos_tag, price_tag, qty_tag = q.position, q.price, q.quantity
+    for p in container.iter(q.point):
+        # Eén pass over de (2-3) kinderen i.p.v. een findtext per veld
+        pos_txt = price_txt = qty_txt = None
+        for child in p:
+            tag = child.tag
+            if tag == pos_tag:
+                pos_txt = child.text
+            elif tag == price_tag:
+                price_txt = child.text
+            elif tag == qty_tag:
+                qty_txt = child.text
+        if not pos_txt:
+            continue
+        try:
+            ipos = int(float(pos_txt))
+        except Exception:
+            continue
+        offset = (ipos - 1) * res_td
+        if fixed_offset and offset < _DST_SAFE_SPAN:
+            stamp_local = start_local + offset
+        else:
+            stamp_local = (start_dt_utc + offset).astimezone(local_tz)
+        items.append(
+            {
+                "timestamp_local": stamp_local,
+                "price": _safe_float(price_txt),
+                "quantity": _safe_float(qty_txt),
+                "resolution": res,
+            }
+        )
+
+
 def ts_points_to_series(d: date, ts: ET.Element, local_tz=TZ_LOCAL) -> List[Dict]:
-    periods = ts.findall(".//{*}Period")
+    # Tags één keer namespace-gekwalificeerd; Point-velden zijn directe kinderen
+    q = _xml_tags(_xml_ns(ts))
+    periods = list(ts.iter(q.period))
     items: List[Dict] = []
 
     if not periods:
-        ti_ts = ts.find(".//{*}timeInterval")
-        start_text = ti_ts.findtext(".//{*}start") if ti_ts is not None else None
-        res_text = ts.findtext(".//{*}resolution")
-        res_td = resolve_resolution_to_timedelta(res_text or "PT60M")
-        start_dt_utc = (
-            parse_iso_dt(start_text)
-            if start_text
-            else datetime(d.year, d.month, d.day, 0, 0, tzinfo=timezone.utc)
-        )
-        for p in ts.findall(".//{*}Point"):
-            pos_txt = p.findtext(".//{*}position")
-            if not pos_txt:
-                continue
-            try:
-                ipos = int(float(pos_txt))
-            except Exception:
-                continue
-            stamp_utc = start_dt_utc + (ipos - 1) * res_td
-            stamp_local = stamp_utc.astimezone(local_tz)
-            items.append(
-                {
-                    "timestamp_local": stamp_local,
-                    "price": _safe_float(p.findtext(".//{*}price.amount")),
-                    "quantity": _safe_float(p.findtext(".//{*}quantity")),
-                    "resolution": res_text or "PT60M",
-                }
-            )
+        ti_ts = next(ts.iter(q.time_interval), None)
+        start_text = ti_ts.findtext(q.start) if ti_ts is not None else None
+        res_text = _first_text(ts, q.resolution)
+        _append_points(items, ts, start_text, res_text, d, local_tz, q)
         return items
 
+    ts_res_text: Optional[str] = None
     for period in periods:
-        ti = period.find(".//{*}timeInterval")
-        start_text = ti.findtext(".//{*}start") if ti is not None else None
-        res_text = period.findtext(".//{*}resolution") or ts.findtext(
-            ".//{*}resolution"
-        )
-        res_td = resolve_resolution_to_timedelta(res_text or "PT60M")
-        start_dt_utc = (
-            parse_iso_dt(start_text)
-            if start_text
-            else datetime(d.year, d.month, d.day, 0, 0, tzinfo=timezone.utc)
-        )
-
-        for p in period.findall(".//{*}Point"):
-            pos_txt = p.findtext(".//{*}position")
-            if not pos_txt:
-                continue
-            try:
-                ipos = int(float(pos_txt))
-            except Exception:
-                continue
-            stamp_utc = start_dt_utc + (ipos - 1) * res_td
-            stamp_local = stamp_utc.astimezone(local_tz)
-            items.append(
-                {
-                    "timestamp_local": stamp_local,
-                    "price": _safe_float(p.findtext(".//{*}price.amount")),
-                    "quantity": _safe_float(p.findtext(".//{*}quantity")),
-                    "resolution": res_text or "PT60M",
-                }
-            )
+        ti = period.find(q.time_interval)
+        start_text = ti.findtext(q.start) if ti is not None else None
+        res_text = period.findtext(q.resolution)
+        if not res_text:
+            if ts_res_text is None:
+                ts_res_text = _first_text(ts, q.resolution) or ""
+            res_text = ts_res_text
+        _append_points(items, period, start_text, res_text, d, local_tz, q)
     return items
 
 
 def coalesce_by_timestamp(
     items: List[Dict], prefer: str = "last", op: str = "mean"
 ) -> List[Dict]:
-    from collections import defaultdict
+    # Eén dict-pass per timestamp; daarna alleen de unieke rijen sorteren
+    if prefer == "last":
+        latest = {it["timestamp_local"]: it for it in items}
+        return sorted(latest.values(), key=itemgetter("timestamp_local"))
+    if prefer == "first":
+        earliest: Dict = {}
+        for it in items:
+            earliest.setdefault(it["timestamp_local"], it)
+        return sorted(earliest.values(), key=itemgetter("timestamp_local"))
 
-    buckets = defaultdict(list)
+    # ts -> [laatste item, som prijs, n prijs, som hoeveelheid, n hoeveelheid]
+    acc: Dict = {}
     for it in items:
-        buckets[it["timestamp_local"]].append(it)
-    merged: List[Dict] = []
-    for ts, arr in buckets.items():
-        if prefer in ("last", "first"):
-            merged.append(arr[-1] if prefer == "last" else arr[0])
+        slot = acc.get(it["timestamp_local"])
+        if slot is None:
+            slot = acc[it["timestamp_local"]] = [it, 0.0, 0, 0.0, 0]
         else:
-            prices = [x["price"] for x in arr if x["price"] is not None]
-            qtys = [x["quantity"] for x in arr if x["quantity"] is not None]
-            avg_price = sum(prices) / len(prices) if prices else None
-            avg_qty = sum(qtys) / len(qtys) if qtys else None
-            base = dict(arr[-1])
-            base["price"] = avg_price
-            base["quantity"] = avg_qty
-            merged.append(base)
-    merged.sort(key=lambda x: x["timestamp_local"])
+            slot[0] = it
+        if it["price"] is not None:
+            slot[1] += it["price"]
+            slot[2] += 1
+        if it["quantity"] is not None:
+            slot[3] += it["quantity"]
+            slot[4] += 1
+    merged: List[Dict] = []
+    for last, p_sum, p_n, q_sum, q_n in acc.values():
+        base = dict(last)
+        base["price"] = p_sum / p_n if p_n else None
+        base["quantity"] = q_sum / q_n if q_n else None
+        merged.append(base)
+    merged.sort(key=itemgetter("timestamp_local"))
     return merged
 
 
@@ -398,8 +583,14 @@ def _infer_date_from_params(params: dict) -> Optional[date]:
         return None
 
 
+# \w = alfanumeriek (Unicode) + "_"; alles behalve \w en "-" wordt "_"
+_UNSAFE_NAME_RE = re.compile(r"[^\w-]")
+
+
+# Een handvol zone-codes en documenttypes; elk maar één keer saneren
+@functools.lru_cache(maxsize=256)
 def _safe_name(s: str) -> str:
-    return "".join(c if c.isalnum() or c in ("-", "_") else "_" for c in s)
+    return _UNSAFE_NAME_RE.sub("_", s)
 
 
 def _data_file_path(params: dict, ext: str = "xml") -> Path:
@@ -432,64 +623,278 @@ def _data_file_path(params: dict, ext: str = "xml") -> Path:
         return folder / fname
 
 
+# In-process memo van de bestandscache: {cache_key: (mtime, xml_text)}.
+# Herhaalde hits binnen de TTL raken de schijf dan niet meer.
+CACHE_MEM_MAX_ENTRIES = 64
+_CACHE_MEM: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+_CACHE_MEM_LOCK = threading.Lock()
+
+
+def _cache_mem_get(cache_key: str, ttl_s: int) -> Optional[str]:
+    with _CACHE_MEM_LOCK:
+        hit = _CACHE_MEM.get(cache_key)
+        if hit is None:
+            return None
+        if time.time() - hit[0] > ttl_s:
+            del _CACHE_MEM[cache_key]
+            return None
+        _CACHE_MEM.move_to_end(cache_key)
+        return hit[1]
+
+
+def _cache_mem_put(cache_key: str, mtime: float, text: str) -> None:
+    with _CACHE_MEM_LOCK:
+        _CACHE_MEM[cache_key] = (mtime, text)
+        _CACHE_MEM.move_to_end(cache_key)
+        while len(_CACHE_MEM) > CACHE_MEM_MAX_ENTRIES:
+            _CACHE_MEM.popitem(last=False)
+
+
+# Validators (ETag/Last-Modified) per cache-digest voor conditionele GETs
+VALIDATORS_MAX_ENTRIES = 256
+_VALIDATORS: "OrderedDict[str, Dict[str, str]]" = OrderedDict()
+
+
+def _remember_validators(cache_key: str, resp) -> None:
+    headers = {}
+    for src, dst in (("ETag", "If-None-Match"), ("Last-Modified", "If-Modified-Since")):
+        value = resp.headers.get(src)
+        if isinstance(value, str) and value:
+            headers[dst] = value
+    with _CACHE_MEM_LOCK:
+        if not headers:
+            _VALIDATORS.pop(cache_key, None)
+            return
+        _VALIDATORS[cache_key] = headers
+        _VALIDATORS.move_to_end(cache_key)
+        while len(_VALIDATORS) > VALIDATORS_MAX_ENTRIES:
+            _VALIDATORS.popitem(last=False)
+
+
+def _conditional_headers(cache_key: str) -> Optional[Dict[str, str]]:
+    with _CACHE_MEM_LOCK:
+        headers = _VALIDATORS.get(cache_key)
+        return dict(headers) if headers else None
+
+
+def clear_memory_cache() -> None:
+    with _CACHE_MEM_LOCK:
+        _CACHE_MEM.clear()
+        _PARSED_ROWS.clear()
+        _VALIDATORS.clear()
+
+
+# Achtergrond-I/O voor cache- en ruwe bestanden
+_IO_POOL = None
+_IO_LOCK = threading.Lock()
+_IO_PENDING: Dict[str, object] = {}
+_IO_QUEUED: Dict[str, str] = {}  # nieuwste nog te schrijven tekst per pad
+
+
+def _atomic_write(path: Path, text: str) -> None:
+    tmp = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp.write_text(text, encoding="utf-8")
+        os.replace(tmp, path)
+    except Exception as e:
+        logging.debug(f"Write failed for {path}: {e}")
+        try:
+            tmp.unlink()
+        except Exception:
+            pass
+
+
+def _drain_writes(path: Path, key: str) -> None:
+    # Schrijft tot er niets meer klaarstaat; tussentijdse versies vallen af
+    while True:
+        with _IO_LOCK:
+            text = _IO_QUEUED.pop(key, None)
+            if text is None:
+                _IO_PENDING.pop(key, None)
+                return
+        _atomic_write(path, text)
+
+
+def _write_in_background(path: Path, text: str) -> None:
+    global _IO_POOL
+    key = str(path)
+    with _IO_LOCK:
+        _IO_QUEUED[key] = text
+        if key in _IO_PENDING:
+            return  # de lopende writer schrijft hierna de nieuwste tekst
+        if _IO_POOL is None:
+            from concurrent.futures import ThreadPoolExecutor
+
+            _IO_POOL = ThreadPoolExecutor(max_workers=2, thread_name_prefix="entsoe-io")
+            atexit.register(_IO_POOL.shutdown, wait=True)
+        _IO_PENDING[key] = _IO_POOL.submit(_drain_writes, path, key)
+
+
+def flush_pending_writes() -> None:
+    with _IO_LOCK:
+        pending = list(_IO_PENDING.values())
+    for fut in pending:
+        fut.result()  # type: ignore[attr-defined]
+
+
+def _cache_digest(params: Dict) -> str:
+    # Canonieke params (zonder token) -> vaste 128-bit sleutel; identieke
+    # requests delen zo één cachebestand, ongeacht de cache_key van de caller
+    canon = json.dumps(
+        {k: v for k, v in params.items() if k != "securityToken"},
+        sort_keys=True,
+        separators=(",", ":"),
+    )
+    return hashlib.blake2b(canon.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def _cache_path(digest: str) -> Path:
+    return CACHE_DIR / digest[:2] / f"{digest}.xml"
+
+
+# Gedeelde HTTP-sessie: keep-alive en hergebruik van TCP/TLS-verbindingen
+_SESSION = None
+_SESSION_LOCK = threading.Lock()
+
+
+def _http_session():
+    global _SESSION
+    if _SESSION is None:
+        with _SESSION_LOCK:
+            if _SESSION is None:
+                import requests
+                from requests.adapters import HTTPAdapter
+
+                session = requests.Session()
+                adapter = HTTPAdapter(
+                    pool_connections=1,
+                    pool_maxsize=max(1, MAX_PARALLEL_REQUESTS),
+                    max_retries=0,  # retries doen we zelf, met backoff
+                )
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                _SESSION = session
+    return _SESSION
+
+
 # HTTP wrapper
+_STATUS_ERRORS = {
+    401: (EntsoeUnauthorized, "Unauthorized"),
+    403: (EntsoeForbidden, "Forbidden"),
+    404: (EntsoeNotFound, "Not Found"),
+    429: (EntsoeRateLimited, "Too Many Requests"),
+}
+
+# Backoff-schema per poging (1-based), eenmalig berekend bij import
+_BACKOFF_SCHEDULE = tuple(
+    min(BACKOFF_CAP_SECONDS, BACKOFF_BASE**attempt)
+    for attempt in range(MAX_RETRIES + 1)
+)
+
+
+def _backoff_sleep(attempt: int, retry_after: Optional[float] = None) -> None:
+    delay = _BACKOFF_SCHEDULE[min(attempt, len(_BACKOFF_SCHEDULE) - 1)]
+    if retry_after is not None:
+        # Server-hint volgen, maar nooit langer dan de cap
+        delay = min(BACKOFF_CAP_SECONDS, max(delay, retry_after))
+    time.sleep(delay * (1 + 0.1 * random.random()))
+
+
+def _retry_after_seconds(resp) -> Optional[float]:
+    # Retry-After is óf een aantal seconden óf een HTTP-datum
+    value = resp.headers.get("Retry-After")
+    if not isinstance(value, str):
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, when.timestamp() - time.time())
+
+
 def request_entsoe(
     params: Dict, cache_key: Optional[str] = None, cache_ttl_s: Optional[int] = None
 ) -> str:
-    if cache_key and cache_ttl_s:
-        cache_file = CACHE_DIR / f"{cache_key}.xml"
+    ttl = cache_ttl_s or 0
+    use_cache = bool(cache_key and ttl)
+    digest = _cache_digest(params) if use_cache else ""
+    stale_file: Optional[Path] = None
+    if use_cache:
+        cached = _cache_mem_get(digest, ttl)
+        if cached is not None:
+            return cached
+        cache_file = _cache_path(digest)
         if cache_file.exists():
-            age = time.time() - cache_file.stat().st_mtime
-            if age <= cache_ttl_s:
-                return cache_file.read_text(encoding="utf-8")
+            mtime = cache_file.stat().st_mtime
+            if time.time() - mtime <= ttl:
+                text = cache_file.read_text(encoding="utf-8")
+                _cache_mem_put(digest, mtime, text)
+                logging.debug(f"Cache hit {cache_key} ({digest})")
+                return text
+            stale_file = cache_file
+    # Verlopen kopie + bekende validators: server mag met 304 antwoorden
+    cond_headers = _conditional_headers(digest) if stale_file else None
 
+    import requests
+
+    # Eén keer opbouwen; elke mislukte poging hergebruikt dit in de details
+    safe_params = {k: v for k, v in params.items() if k != "securityToken"}
     params = dict(params)
     params["securityToken"] = require_api_key()
 
     last_exc = None
     for attempt in range(1, MAX_RETRIES + 1):
         try:
-            resp = requests.get(API_ENDPOINT, params=params, timeout=HTTP_READ_TIMEOUT)
+            resp = _http_session().get(
+                API_ENDPOINT,
+                params=params,
+                headers=cond_headers,
+                timeout=HTTP_READ_TIMEOUT,
+            )
             status = resp.status_code
             logging.info(f"Request {attempt} - Status: {status}")
+            if status == 304 and stale_file is not None:
+                # Ongewijzigd: verlopen kopie hergebruiken en TTL verversen
+                text = stale_file.read_text(encoding="utf-8")
+                now = time.time()
+                os.utime(stale_file, (now, now))
+                _cache_mem_put(digest, now, text)
+                logging.debug(f"Not modified {cache_key} ({digest})")
+                return text
             if status == 200:
+                # ENTSO-E XML is altijd UTF-8. Zonder charset zou requests een
+                # tekenset-detectie over de hele body doen, en bij text/xml
+                # ISO-8859-1 aannemen; dus altijd zelf vastzetten
+                resp.encoding = "utf-8"
                 text = resp.text
-                if cache_key and cache_ttl_s:
-                    try:
-                        (CACHE_DIR / f"{cache_key}.xml").write_text(
-                            text, encoding="utf-8"
-                        )
-                    except Exception:
-                        pass
+                # Schrijven gebeurt op de achtergrond; de aanroeper wacht niet
+                if use_cache:
+                    _cache_mem_put(digest, time.time(), text)
+                    _remember_validators(digest, resp)
+                    _write_in_background(_cache_path(digest), text)
                 if SAVE_RAW:
-                    path = _data_file_path(params)
-                    try:
-                        path.write_text(text, encoding="utf-8")
-                    except Exception:
-                        pass
+                    _write_in_background(_data_file_path(params), text)
                 return text
 
             err_detail = extract_entsoe_error(resp.text) or resp.text[:200]
             details = {
                 "entsoe_message": err_detail,
                 "http_status": status,
-                "request_params": {
-                    k: v for k, v in params.items() if k != "securityToken"
-                },
+                "request_params": safe_params,
             }
-
-            if status == 401:
-                raise EntsoeUnauthorized(
-                    f"401 Unauthorized: {err_detail}", details=details
-                )
-            if status == 403:
-                raise EntsoeForbidden(f"403 Forbidden: {err_detail}", details=details)
-            if status == 404:
-                raise EntsoeNotFound(f"404 Not Found: {err_detail}", details=details)
-            if status == 429:
-                raise EntsoeRateLimited(
-                    f"429 Too Many Requests: {err_detail}", details=details
-                )
+            if status in (429, 503):
+                retry_after = _retry_after_seconds(resp)
+                if retry_after is not None:
+                    details["retry_after_s"] = retry_after
+
+            mapped = _STATUS_ERRORS.get(status)
+            if mapped is not None:
+                err_cls, reason = mapped
+                raise err_cls(f"{status} {reason}: {err_detail}", details=details)
             if 500 <= status < 600:
                 raise EntsoeServerError(
                     f"{status} Server Error: {err_detail}", status=502, details=details
@@ -504,19 +909,13 @@ def request_entsoe(
         except (EntsoeRateLimited, EntsoeServerError) as e:
             last_exc = e
             if attempt < MAX_RETRIES:
-                time.sleep(
-                    min(BACKOFF_CAP_SECONDS, (BACKOFF_BASE**attempt))
-                    * (1 + 0.1 * random.random())
-                )
+                _backoff_sleep(attempt, e.details.get("retry_after_s"))
                 continue
             break
         except (requests.Timeout, requests.ConnectionError) as e:
             last_exc = e
             if attempt < MAX_RETRIES:
-                time.sleep(
-                    min(BACKOFF_CAP_SECONDS, (BACKOFF_BASE**attempt))
-                    * (1 + 0.1 * random.random())
-                )
+                _backoff_sleep(attempt)
                 continue
             break
         except EntsoeError:
@@ -524,10 +923,7 @@ def request_entsoe(
         except Exception as e:
             last_exc = e
             if attempt < MAX_RETRIES:
-                time.sleep(
-                    min(BACKOFF_CAP_SECONDS, (BACKOFF_BASE**attempt))
-                    * (1 + 0.1 * random.random())
-                )
+                _backoff_sleep(attempt)
                 continue
             break
 
@@ -539,6 +935,21 @@ def request_entsoe(
     )
 
 
+# Parallel ophalen (I/O-bound, dus threads)
+def _gather(tasks: List[Tuple]) -> List:
+    from concurrent.futures import ThreadPoolExecutor
+
+    if not tasks:
+        return []
+    if len(tasks) == 1:
+        fn, args = tasks[0]
+        return [fn(*args)]
+    workers = max(1, min(MAX_PARALLEL_REQUESTS, len(tasks)))
+    with ThreadPoolExecutor(max_workers=workers) as ex:
+        futures = [ex.submit(fn, *args) for fn, args in tasks]
+        return [f.result() for f in futures]
+
+
 # Normalisatie helpers
 def eur_mwh_to_ct_kwh(v: float) -> float:
     return v / 10.0
@@ -555,7 +966,7 @@ def rows_from_items_price(items: List[Dict]) -> List[Dict]:
         rows.append(
             {
                 "position": idx,
-                "hour_local": ts_local.strftime("%Y-%m-%d %H:%M"),
+                "hour_local": fmt_hour_local(ts_local),
                 "eur_per_mwh": round(it["price"], 6),
                 "ct_per_kwh": round(eur_mwh_to_ct_kwh(it["price"]), 6),
                 "resolution": res_text,
@@ -576,7 +987,7 @@ def rows_from_items_quantity(items: List[Dict], quantity_key_out: str) -> List[D
         rows.append(
             {
                 "position": idx,
-                "hour_local": ts_local.strftime("%Y-%m-%d %H:%M"),
+                "hour_local": fmt_hour_local(ts_local),
                 quantity_key_out: round(q, 3),
                 "resolution": res_text,
             }
@@ -585,55 +996,90 @@ def rows_from_items_quantity(items: List[Dict], quantity_key_out: str) -> List[D
 
 
 # Datasets
+def _series_items(d: date, xml: str) -> List[Dict]:
+    items: List[Dict] = []
+    for ts in pick_timeseries(parse_xml(xml)):
+        items.extend(ts_points_to_series(d, ts, local_tz=TZ_LOCAL))
+    return items
+
+
+# Geparste rijen per (builder, dag, xml-digest): een cache-hit op dezelfde
+# XML slaat parsen en normaliseren over. Aanroepers krijgen kopieën.
+PARSED_MEMO_MAX_ENTRIES = 64
+_PARSED_ROWS: "OrderedDict[tuple, List[Dict]]" = OrderedDict()
+
+
+def _xml_memo(fn):
+    @functools.wraps(fn)
+    def wrapper(d: date, xml: str, *extra) -> List[Dict]:
+        digest = hashlib.blake2b(xml.encode("utf-8"), digest_size=16).digest()
+        key = (fn.__name__, d, digest, extra)
+        with _CACHE_MEM_LOCK:
+            rows = _PARSED_ROWS.get(key)
+            if rows is not None:
+                _PARSED_ROWS.move_to_end(key)
+        if rows is None:
+            rows = fn(d, xml, *extra)
+            with _CACHE_MEM_LOCK:
+                _PARSED_ROWS[key] = rows
+                while len(_PARSED_ROWS) > PARSED_MEMO_MAX_ENTRIES:
+                    _PARSED_ROWS.popitem(last=False)
+        return [dict(r) for r in rows]
+
+    return wrapper
+
+
+@_xml_memo
+def _price_rows(d: date, xml: str) -> List[Dict]:
+    return rows_from_items_price(_series_items(d, xml))
+
+
+@_xml_memo
+def _quantity_rows(d: date, xml: str, quantity_key_out: str) -> List[Dict]:
+    return rows_from_items_quantity(_series_items(d, xml), quantity_key_out)
+
+
 def get_day_ahead_prices(
     d: date, zone: str = ZONE_EIC_DEFAULT, cache_ttl_s: int = TTL_PRICES_DEFAULT
 ) -> List[Dict]:
-    start, end = local_span_day(d)
+    period_start, period_end = _period_span(d)
     params = {
         "documentType": DOC_A44_PRICES,
         "in_Domain": zone,
         "out_Domain": zone,
-        "periodStart": fmt_period(start),
-        "periodEnd": fmt_period(end),
+        "periodStart": period_start,
+        "periodEnd": period_end,
     }
     xml = request_entsoe(
         params, cache_key=f"A44_{zone}_{d.isoformat()}", cache_ttl_s=cache_ttl_s
     )
-    root = parse_xml(xml)
-    items: List[Dict] = []
-    for ts in pick_timeseries(root):
-        items.extend(ts_points_to_series(d, ts, local_tz=TZ_LOCAL))
-    return rows_from_items_price(items)
+    return _price_rows(d, xml)
 
 
 def get_day_ahead_total_load_forecast(
     d: date, zone: str = ZONE_EIC_DEFAULT, cache_ttl_s: int = TTL_LOAD_DA_DEFAULT
 ) -> List[Dict]:
-    start, end = local_span_day(d)
+    period_start, period_end = _period_span(d)
     params = {
         "documentType": DOC_A65_LOAD_DA,
         "processType": "A01",
         "outBiddingZone_Domain": zone,
-        "periodStart": fmt_period(start),
-        "periodEnd": fmt_period(end),
+        "periodStart": period_start,
+        "periodEnd": period_end,
     }
     xml = request_entsoe(
         params, cache_key=f"A65_DA_{zone}_{d.isoformat()}", cache_ttl_s=cache_ttl_s
     )
-    root = parse_xml(xml)
-    items: List[Dict] = []
-    for ts in pick_timeseries(root):
-        items.extend(ts_points_to_series(d, ts, local_tz=TZ_LOCAL))
-    return rows_from_items_quantity(items, "forecast_mw")
+    return _quantity_rows(d, xml, "forecast_mw")
 
 
 def _build_params_a68(d: date, zone: str) -> Dict[str, str]:
-    start, end = local_span_day(d)
+    period_start, period_end = _period_span(d)
     params = {
         "documentType": DOC_A68_LOAD_ACT,
         "outBiddingZone_Domain": zone,
-        "periodStart": fmt_period(start),
-        "periodEnd": fmt_period(end),
+        "periodStart": period_start,
+        "periodEnd": period_end,
     }
     if REQUIRE_IN_DOMAIN_A68:
         params["in_Domain"] = zone
@@ -648,43 +1094,42 @@ def get_total_load(
     ttl_da: int = TTL_LOAD_DA_DEFAULT,
     ttl_act: int = TTL_LOAD_ACT_DEFAULT,
 ) -> Dict[str, List[Dict]]:
-    start, end = local_span_day(d)
+    period_start, period_end = _period_span(d)
     # Day-ahead
     params_da = {
         "documentType": DOC_A65_LOAD_DA,
         "processType": "A01",
         "outBiddingZone_Domain": zone,
-        "periodStart": fmt_period(start),
-        "periodEnd": fmt_period(end),
+        "periodStart": period_start,
+        "periodEnd": period_end,
     }
     xml_da = request_entsoe(
         params_da, cache_key=f"A65_{zone}_{d.isoformat()}", cache_ttl_s=ttl_da
     )
-    root_da = parse_xml(xml_da)
-    items_da: List[Dict] = []
-    for ts in pick_timeseries(root_da):
-        items_da.extend(ts_points_to_series(d, ts, local_tz=TZ_LOCAL))
-    rows_da = rows_from_items_quantity(items_da, "load_mw")
+    rows_da = _quantity_rows(d, xml_da, "load_mw")
 
     # Actual
     params_act = _build_params_a68(d, zone)
     xml_act = request_entsoe(
         params_act, cache_key=f"A68_{zone}_{d.isoformat()}", cache_ttl_s=ttl_act
     )
-    root_act = parse_xml(xml_act)
-    items_act: List[Dict] = []
-    for ts in pick_timeseries(root_act):
-        items_act.extend(ts_points_to_series(d, ts, local_tz=TZ_LOCAL))
-    rows_act = rows_from_items_quantity(items_act, "load_mw")
+    rows_act = _quantity_rows(d, xml_act, "load_mw")
 
     return {"day_ahead": rows_da, "actual": rows_act}
 
 
-def _parse_generation_rows(d: date, root: ET.Element) -> List[Dict]:
+def _parse_generation_rows(
+    d: date, root: ET.Element, psr_filter: Optional[FrozenSet[str]] = None
+) -> List[Dict]:
     enriched: List[Dict] = []
+    tags = _xml_tags(_xml_ns(root))
     for ts in pick_timeseries(root):
-        ptype = ts.findtext(".//{*}productionType")
-        psr = ts.findtext(".//{*}psrType")
+        ptype = _first_text(ts, tags.production_type)
+        psr = _first_text(ts, tags.psr_type)
+        ptype = sys.intern(ptype) if ptype else ptype
+        psr = sys.intern(psr) if psr else psr
+        if psr_filter is not None and psr not in psr_filter:
+            continue
         items = ts_points_to_series(d, ts, local_tz=TZ_LOCAL)
         for it in items:
             enriched.append(
@@ -715,14 +1160,19 @@ def _parse_generation_rows(d: date, root: ET.Element) -> List[Dict]:
 
     merged.sort(key=lambda x: (x.get("psr_type") or "", x["timestamp_local"]))
     rows: List[Dict] = []
-    for idx, it in enumerate(merged, start=1):
+    # Met filter nummeren we per psrType, net als losse per-psr responses
+    idx, group = 0, None
+    for it in merged:
+        if psr_filter is not None and it["psr_type"] != group:
+            idx, group = 0, it["psr_type"]
+        idx += 1
         q = it["quantity"]
         if q is None:
             continue
         rows.append(
             {
                 "position": idx,
-                "hour_local": it["timestamp_local"].strftime("%Y-%m-%d %H:%M"),
+                "hour_local": fmt_hour_local(it["timestamp_local"]),
                 "production_type": it.get("production_type") or "UNKNOWN",
                 "psr_type": it.get("psr_type"),
                 "forecast_mw": round(q, 3),
@@ -732,22 +1182,31 @@ def _parse_generation_rows(d: date, root: ET.Element) -> List[Dict]:
     return rows
 
 
+@_xml_memo
+def _generation_rows(
+    d: date, xml: str, psr_filter: Optional[FrozenSet[str]]
+) -> List[Dict]:
+    return _parse_generation_rows(d, parse_xml(xml), psr_filter)
+
+
 def get_generation_forecast(
     d: date,
     zone: str = ZONE_EIC_DEFAULT,
     cache_ttl_s: int = TTL_GEN_DEFAULT,
     psr_types: Optional[Iterable[str]] = None,
 ) -> List[Dict]:
-    start, end = local_span_day(d)
+    period_start, period_end = _period_span(d)
 
-    def call_one(psr: Optional[str]) -> List[Dict]:
+    def call_one(
+        psr: Optional[str], psr_filter: Optional[FrozenSet[str]] = None
+    ) -> List[Dict]:
         params = {
             "documentType": DOC_A69_GEN_FORECAST,
             "processType": "A01",
             "in_Domain": zone,
             "out_Domain": zone,
-            "periodStart": fmt_period(start),
-            "periodEnd": fmt_period(end),
+            "periodStart": period_start,
+            "periodEnd": period_end,
         }
         cache_suf = "ALL"
         if psr:
@@ -758,61 +1217,51 @@ def get_generation_forecast(
             cache_key=f"A69_{zone}_{d.isoformat()}_{cache_suf}",
             cache_ttl_s=cache_ttl_s,
         )
-        root = parse_xml(xml)
-        return _parse_generation_rows(d, root)
-
-    if psr_types:
-        merged: List[Dict] = []
-        for psr in psr_types:
-            merged.extend(call_one(psr))
-        merged.sort(key=lambda r: (r.get("psr_type") or "", r["position"]))
-        return merged
-    else:
-        return call_one(None)
+        return _generation_rows(d, xml, psr_filter)
+
+    psr_list = list(psr_types or [])
+    if len(psr_list) == 1:
+        return call_one(psr_list[0])
+    if psr_list:
+        # De ongefilterde A69-response bevat alle psrTypes: één request i.p.v. N
+        return call_one(None, frozenset(psr_list))
+    return call_one(None)
 
 
 def get_net_position(
     d: date, zone: str = ZONE_EIC_DEFAULT, cache_ttl_s: int = TTL_NETPOS_DEFAULT
 ) -> List[Dict]:
-    start, end = local_span_day(d)
+    period_start, period_end = _period_span(d)
     params = {
         "documentType": DOC_A75_NET_POSITION,
         "in_Domain": zone,
         "out_Domain": zone,
-        "periodStart": fmt_period(start),
-        "periodEnd": fmt_period(end),
+        "periodStart": period_start,
+        "periodEnd": period_end,
     }
     xml = request_entsoe(
         params, cache_key=f"A75_{zone}_{d.isoformat()}", cache_ttl_s=cache_ttl_s
     )
-    root = parse_xml(xml)
-    items: List[Dict] = []
-    for ts in pick_timeseries(root):
-        items.extend(ts_points_to_series(d, ts, local_tz=TZ_LOCAL))
-    return rows_from_items_quantity(items, "net_position_mw")
+    return _quantity_rows(d, xml, "net_position_mw")
 
 
 def get_scheduled_exchanges(
     d: date, from_zone: str, to_zone: str, cache_ttl_s: int = TTL_EXCH_DEFAULT
 ) -> List[Dict]:
-    start, end = local_span_day(d)
+    period_start, period_end = _period_span(d)
     params = {
         "documentType": DOC_A01_SCHED_EXCH,
         "in_Domain": from_zone,
         "out_Domain": to_zone,
-        "periodStart": fmt_period(start),
-        "periodEnd": fmt_period(end),
+        "periodStart": period_start,
+        "periodEnd": period_end,
     }
     xml = request_entsoe(
         params,
         cache_key=f"A01_{from_zone}_{to_zone}_{d.isoformat()}",
         cache_ttl_s=cache_ttl_s,
     )
-    root = parse_xml(xml)
-    items: List[Dict] = []
-    for ts in pick_timeseries(root):
-        items.extend(ts_points_to_series(d, ts, local_tz=TZ_LOCAL))
-    return rows_from_items_quantity(items, "scheduled_mw")
+    return _quantity_rows(d, xml, "scheduled_mw")
 
 
 # Planning helpers
@@ -825,60 +1274,79 @@ def percentile_threshold(values: List[float], pct: float) -> float:
 
 
 def plan_cheapest_hours(prices_rows: List[Dict], share_pct: float = 30.0) -> List[int]:
-    vals = [(r["position"], r["ct_per_kwh"]) for r in prices_rows]
-    if not vals:
+    if not prices_rows:
         return []
-    vals.sort(key=lambda t: t[1])
-    n = len(vals)
+    n = len(prices_rows)
     k = max(1, int(math.ceil(n * (share_pct / 100.0))))
-    return sorted([pos for pos, _ in vals[:k]])
+    # Direct op de rijen sorteren (stabiel, C-key) i.p.v. eerst tuples bouwen
+    cheapest = sorted(prices_rows, key=itemgetter("ct_per_kwh"))[:k]
+    return sorted([r["position"] for r in cheapest])
+
+
+def _dense_by_position(rows: List[Dict], key: str, default: float) -> List[float]:
+    # Posities zijn 1..N (met hooguit een paar gaten): lijst met index = positie - 1
+    if not rows:
+        return []
+    positions = [int(r["position"]) for r in rows]
+    out = [default] * max(positions)
+    for pos, r in zip(positions, rows):
+        if pos < 1:
+            continue  # ongeldige positie; zou anders out[-1] overschrijven
+        out[pos - 1] = float(r.get(key, default))
+    return out
 
 
 def merge_with_fallback(rows: List[Dict], key: str, default: float) -> Dict[int, float]:
-    m: Dict[int, float] = {}
-    for r in rows:
-        m[int(r["position"])] = float(r.get(key, default))
-    if m:
-        for pos in range(1, max(m.keys()) + 1):
-            if pos not in m:
-                m[pos] = default
-    return m
+    return dict(enumerate(_dense_by_position(rows, key, default), start=1))
 
 
 def suggest_automation(d: date, zone: str = ZONE_EIC_DEFAULT) -> Dict:
     today = date.today()
-    prices = get_day_ahead_prices(d, zone)
+    da_only = SKIP_A68_FOR_FUTURE and d > today
+    # Prijzen, opwek en load zijn onafhankelijk: gelijktijdig ophalen
+    prices, gen, load = _gather(
+        [
+            (get_day_ahead_prices, (d, zone)),
+            (
+                functools.partial(
+                    get_generation_forecast, psr_types=["B16", "B18", "B19"]
+                ),
+                (d, zone),
+            ),
+            (
+                get_day_ahead_total_load_forecast if da_only else get_total_load,
+                (d, zone),
+            ),
+        ]
+    )
     if not prices:
         raise EntsoeServerError("No prices – cannot create a plan.", status=502)
     cheapest = plan_cheapest_hours(prices, share_pct=30.0)
 
-    gen = get_generation_forecast(d, zone, psr_types=["B16", "B18", "B19"])
-
-    if SKIP_A68_FOR_FUTURE and d > today:
-        da_rows = get_day_ahead_total_load_forecast(d, zone)
-        load_da_map = merge_with_fallback(da_rows, "forecast_mw", default=0.0)
+    if da_only:
+        load_arr = _dense_by_position(load, "forecast_mw", 0.0)
     else:
-        load = get_total_load(d, zone)
-        load_da_map = merge_with_fallback(load["day_ahead"], "load_mw", default=0.0)
-
-    wind_solar_mw: Dict[int, float] = {}
+        load_arr = _dense_by_position(load["day_ahead"], "load_mw", 0.0)
+    price_arr = _dense_by_position(prices, "ct_per_kwh", 999.0)
+    price_p30 = percentile_threshold(price_arr, 30)
+    load_p80 = percentile_threshold(load_arr, 80)
+
+    # Vaste lijsten per positie (index = positie - 1) in plaats van dicts
+    n = len(price_arr)
+    wind_solar_mw = [0.0] * n
     for r in gen:
-        pos = int(r["position"])
-        wind_solar_mw[pos] = wind_solar_mw.get(pos, 0.0) + float(r["forecast_mw"])
-
-    price_map = merge_with_fallback(prices, "ct_per_kwh", default=999.0)
-    price_list = [price_map.get(p, 999.0) for p in sorted(price_map.keys())]
-    load_list = [load_da_map.get(p, 0.0) for p in sorted(load_da_map.keys())]
-    price_p30 = percentile_threshold(price_list, 30)
-    load_p80 = percentile_threshold(load_list, 80)
-
-    recommended: List[int] = []
-    for pos in sorted(price_map.keys()):
-        cheap = price_map[pos] <= price_p30
-        green = wind_solar_mw.get(pos, 0.0) > 0.0
-        not_peak = load_da_map.get(pos, 0.0) <= load_p80
-        if cheap and (green or not_peak):
-            recommended.append(pos)
+        i = int(r["position"]) - 1
+        if 0 <= i < n:
+            wind_solar_mw[i] += float(r["forecast_mw"])
+    load_for_price = load_arr[:n] + [0.0] * (n - len(load_arr))
+
+    recommended = [
+        pos
+        for pos, price, ws, ld in zip(
+            range(1, n + 1), price_arr, wind_solar_mw, load_for_price
+        )
+        if price <= price_p30 and (ws > 0.0 or ld <= load_p80)
+    ]
 
     rec_set = sorted(set(recommended + cheapest))
     return {
@@ -900,145 +1368,240 @@ def parse_date(arg: Optional[str]) -> date:
     return date.fromisoformat(arg) if arg else (date.today() + timedelta(days=1))
 
 
-def _print_error(e: EntsoeError):
-    err = {"error": e.to_dict()}
-    print(json.dumps(err, indent=2, ensure_ascii=False), file=sys.stderr)
+# Eén validatiepad voor alle datumargumenten
+def _parse_date_arg(arg: str) -> date:
+    try:
+        return date.fromisoformat(arg)
+    except ValueError:
+        raise EntsoeError(
+            f"Invalid date {arg!r}, expected YYYY-MM-DD",
+            status=400,
+            code="BAD_REQUEST",
+        )
 
 
-def cmd_prices(args: List[str]):
+# None = automatisch: ingesprongen op een terminal, compact in een pipe
+PRETTY_OUTPUT: Optional[bool] = None
+
+
+def _pretty() -> bool:
+    if PRETTY_OUTPUT is not None:
+        return PRETTY_OUTPUT
     try:
-        d = parse_date(args[0] if len(args) >= 1 else None)
-        zone = args[1] if len(args) >= 2 else ZONE_EIC_DEFAULT
-        rows = get_day_ahead_prices(d, zone)
-        print(
-            json.dumps(
-                {"date": d.isoformat(), "zone": zone, "prices": rows},
-                indent=2,
-                ensure_ascii=False,
-            )
-        )
-    except EntsoeError as e:
-        _print_error(e)
-        sys.exit(1)
+        return sys.stdout.isatty()
+    except Exception:
+        return False
+
+
+# Vooraf geconfigureerde encoders voor de stdlib-fallback (json.dumps met
+# niet-standaard opties bouwt anders per aanroep een nieuwe JSONEncoder)
+_JSON_PRETTY = json.JSONEncoder(indent=2, ensure_ascii=False)
+_JSON_COMPACT = json.JSONEncoder(separators=(",", ":"), ensure_ascii=False)
+
+
+def _dumps(payload, pretty: bool) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(payload, option=orjson.OPT_INDENT_2 if pretty else 0)
+    encoder = _JSON_PRETTY if pretty else _JSON_COMPACT
+    return encoder.encode(payload).encode("utf-8")
 
 
-def cmd_load(args: List[str]):
+def _write_stdout(buf: bytes) -> None:
     try:
-        d = parse_date(args[0] if len(args) >= 1 else None)
-        zone = args[1] if len(args) >= 2 else ZONE_EIC_DEFAULT
-        payload = get_total_load(d, zone)
-        print(
-            json.dumps(
-                {"date": d.isoformat(), "zone": zone, "load": payload},
-                indent=2,
-                ensure_ascii=False,
-            )
-        )
-    except EntsoeError as e:
-        _print_error(e)
+        fd = sys.stdout.fileno()
+    except (AttributeError, OSError, ValueError):
+        # stdout vervangen (tests, embedding): via de tekstlaag
+        sys.stdout.write(buf.decode("utf-8"))
+        return
+    sys.stdout.flush()
+    view = memoryview(buf)
+    try:
+        while view:
+            view = view[os.write(fd, view) :]
+    except BrokenPipeError:
+        # Lezer is weg (bv. `| head`): stil stoppen zonder traceback bij exit
+        devnull = os.open(os.devnull, os.O_WRONLY)
+        os.dup2(devnull, fd)
         sys.exit(1)
 
 
-def cmd_gen_forecast(args: List[str]):
-    try:
-        d = parse_date(args[0] if len(args) >= 1 else None)
-        zone = args[1] if len(args) >= 2 else ZONE_EIC_DEFAULT
-        psr_types = args[2:] if len(args) >= 3 else None
-        rows = get_generation_forecast(d, zone, psr_types=psr_types)
-        out = {
+def _emit(payload) -> None:
+    _write_stdout(_dumps(payload, _pretty()) + b"\n")
+
+
+def _emit_rows(head: Dict[str, str], key: str, rows: List[Dict]) -> None:
+    if not rows and not _pretty():
+        # Lege dataset (bv. geen exchanges die dag): vaste regel, geen encoder
+        quote = json.encoder.encode_basestring
+        fields = "".join(f"{quote(k)}:{quote(v)}," for k, v in head.items())
+        _write_stdout(f'{{{fields}"{key}":[]}}\n'.encode("utf-8"))
+        return
+    payload: Dict = dict(head)
+    payload[key] = rows
+    _emit(payload)
+
+
+def _print_error(e: EntsoeError):
+    err = {"error": e.to_dict()}
+    print(json.dumps(err, indent=2, ensure_ascii=False), file=sys.stderr)
+
+
+def _ns_date(ns: argparse.Namespace) -> date:
+    return ns.date or parse_date(None)
+
+
+def _cli_errors(fn):
+    @functools.wraps(fn)
+    def wrapper(ns: argparse.Namespace):
+        try:
+            return fn(ns)
+        except EntsoeError as e:
+            _print_error(e)
+            sys.exit(1)
+
+    return wrapper
+
+
+@_cli_errors
+def cmd_prices(ns: argparse.Namespace):
+    d = _ns_date(ns)
+    rows = get_day_ahead_prices(d, ns.zone)
+    _emit_rows({"date": d.isoformat(), "zone": ns.zone}, "prices", rows)
+
+
+@_cli_errors
+def cmd_load(ns: argparse.Namespace):
+    d = _ns_date(ns)
+    payload = get_total_load(d, ns.zone)
+    _emit({"date": d.isoformat(), "zone": ns.zone, "load": payload})
+
+
+@_cli_errors
+def cmd_gen_forecast(ns: argparse.Namespace):
+    d = _ns_date(ns)
+    psr_types = ns.psr_types or None
+    rows = get_generation_forecast(d, ns.zone, psr_types=psr_types)
+    out = {
+        "date": d.isoformat(),
+        "zone": ns.zone,
+        "psr_types": psr_types or ["ALL"],
+        "generation_forecast": rows,
+    }
+    _emit(out)
+
+
+@_cli_errors
+def cmd_netpos(ns: argparse.Namespace):
+    d = _ns_date(ns)
+    rows = get_net_position(d, ns.zone)
+    _emit_rows({"date": d.isoformat(), "zone": ns.zone}, "net_position", rows)
+
+
+@_cli_errors
+def cmd_exchanges(ns: argparse.Namespace):
+    d = ns.date
+    rows = get_scheduled_exchanges(d, ns.from_zone, ns.to_zone)
+    _emit_rows(
+        {"date": d.isoformat(), "from_zone": ns.from_zone, "to_zone": ns.to_zone},
+        "scheduled_exchanges",
+        rows,
+    )
+
+
+@_cli_errors
+def cmd_plan(ns: argparse.Namespace):
+    d = _ns_date(ns)
+    plan = suggest_automation(d, ns.zone)
+    _emit(plan)
+
+
+@_cli_errors
+def cmd_all(ns: argparse.Namespace):
+    d = _ns_date(ns)
+    zone = ns.zone
+    prices, load_da, gen, netpos = _gather(
+        [
+            (get_day_ahead_prices, (d, zone)),
+            (get_day_ahead_total_load_forecast, (d, zone)),
+            (get_generation_forecast, (d, zone)),
+            (get_net_position, (d, zone)),
+        ]
+    )
+    _emit(
+        {
             "date": d.isoformat(),
             "zone": zone,
-            "psr_types": psr_types or ["ALL"],
-            "generation_forecast": rows,
+            "prices": prices,
+            "load_forecast": load_da,
+            "generation_forecast": gen,
+            "net_position": netpos,
         }
-        print(json.dumps(out, indent=2, ensure_ascii=False))
-    except EntsoeError as e:
-        _print_error(e)
-        sys.exit(1)
+    )
 
 
-def cmd_netpos(args: List[str]):
-    try:
-        d = parse_date(args[0] if len(args) >= 1 else None)
-        zone = args[1] if len(args) >= 2 else ZONE_EIC_DEFAULT
-        rows = get_net_position(d, zone)
-        print(
-            json.dumps(
-                {"date": d.isoformat(), "zone": zone, "net_position": rows},
-                indent=2,
-                ensure_ascii=False,
-            )
-        )
-    except EntsoeError as e:
-        _print_error(e)
-        sys.exit(1)
+class _ArgParser(argparse.ArgumentParser):
+    # Gebruiksfouten als JSON op stderr, net als de overige fouten
+    def error(self, message):
+        raise EntsoeError(message, status=400, code="BAD_REQUEST")
 
 
-def cmd_exchanges(args: List[str]):
-    try:
-        if len(args) < 3:
-            raise EntsoeError(
-                "Usage: exchanges [YYYY-MM-DD] FROM_EIC TO_EIC",
-                status=400,
-                code="BAD_REQUEST",
-            )
-        d = date.fromisoformat(args[0])
-        from_zone = args[1]
-        to_zone = args[2]
-        rows = get_scheduled_exchanges(d, from_zone, to_zone)
-        print(
-            json.dumps(
-                {
-                    "date": d.isoformat(),
-                    "from_zone": from_zone,
-                    "to_zone": to_zone,
-                    "scheduled_exchanges": rows,
-                },
-                indent=2,
-                ensure_ascii=False,
-            )
-        )
-    except EntsoeError as e:
-        _print_error(e)
-        sys.exit(1)
+def _build_parser() -> argparse.ArgumentParser:
+    common = _ArgParser(add_help=False)
+    out = common.add_mutually_exclusive_group()
+    out.add_argument(
+        "--pretty", dest="pretty", action="store_true", default=argparse.SUPPRESS
+    )
+    out.add_argument(
+        "--compact", dest="pretty", action="store_false", default=argparse.SUPPRESS
+    )
+    common.add_argument(
+        "-v", "--verbose", action="store_true", default=argparse.SUPPRESS
+    )
 
+    parser = _ArgParser(prog="ha_entsoe.py", parents=[common])
+    sub = parser.add_subparsers(dest="cmd", parser_class=_ArgParser)
+
+    def add(name: str, func, help_text: str, with_zone: bool = True):
+        p = sub.add_parser(name, parents=[common], help=help_text)
+        p.add_argument("date", nargs="?", type=_parse_date_arg, default=None)
+        if with_zone:
+            p.add_argument("zone", nargs="?", default=ZONE_EIC_DEFAULT)
+        p.set_defaults(func=func)
+        return p
+
+    add("prices", cmd_prices, "Day-ahead prices (A44)")
+    add("load", cmd_load, "Total load day-ahead (A65) and actual (A68)")
+    gen = add("gen-forecast", cmd_gen_forecast, "Generation forecast (A69)")
+    gen.add_argument("psr_types", nargs="*", metavar="psrType")
+    add("netpos", cmd_netpos, "Net position (A75)")
+    exch = sub.add_parser(
+        "exchanges", parents=[common], help="Scheduled exchanges (A01)"
+    )
+    exch.add_argument("date", type=_parse_date_arg)
+    exch.add_argument("from_zone")
+    exch.add_argument("to_zone")
+    exch.set_defaults(func=cmd_exchanges)
+    add("plan", cmd_plan, "Cheapest/recommended hours")
+    add("all", cmd_all, "Prices, load forecast, generation and net position")
+    return parser
 
-def cmd_plan(args: List[str]):
-    try:
-        d = parse_date(args[0] if len(args) >= 1 else None)
-        zone = args[1] if len(args) >= 2 else ZONE_EIC_DEFAULT
-        plan = suggest_automation(d, zone)
-        print(json.dumps(plan, indent=2, ensure_ascii=False))
-    except EntsoeError as e:
-        _print_error(e)
-        sys.exit(1)
 
+_PARSER = _build_parser()
 
-def main():
-    if len(sys.argv) < 2:
-        print(
-            "Commands: prices | load | gen-forecast | netpos | exchanges | plan",
-            file=sys.stderr,
-        )
-        sys.exit(2)
-    cmd = sys.argv[1]
-    args = sys.argv[2:]
+
+def main(argv: Optional[List[str]] = None):
+    global PRETTY_OUTPUT
     try:
-        if cmd == "prices":
-            cmd_prices(args)
-        elif cmd == "load":
-            cmd_load(args)
-        elif cmd == "gen-forecast":
-            cmd_gen_forecast(args)
-        elif cmd == "netpos":
-            cmd_netpos(args)
-        elif cmd == "exchanges":
-            cmd_exchanges(args)
-        elif cmd == "plan":
-            cmd_plan(args)
-        else:
-            raise EntsoeError(f"Unknown command: {cmd}", status=400, code="BAD_REQUEST")
+        ns = _PARSER.parse_args(argv)
+        if not getattr(ns, "func", None):
+            _PARSER.print_usage(sys.stderr)
+            sys.exit(2)
+        PRETTY_OUTPUT = getattr(ns, "pretty", None)
+        if getattr(ns, "verbose", False):
+            logging.getLogger().setLevel(logging.DEBUG)
+        ns.func(ns)
     except EntsoeError as e:
+        # Alleen argumentfouten; commandofouten vangt _cli_errors af
         _print_error(e)
         sys.exit(1)
     except Exception as e:
@@ -4,15 +4,14 @@ Pytest configuration and fixtures for ENTSO-E testing
 
 import pytest
 from datetime import datetime, timedelta
+from types import SimpleNamespace
+from zoneinfo import ZoneInfo
 from unittest.mock import Mock, patch
-import pytz
 from fastapi.testclient import TestClient
 
+AMSTERDAM_TZ = ZoneInfo("Europe/Amsterdam")
 
-@pytest.fixture
-def mock_entsoe_response():
-    """Mock ENTSO-E API response for testing"""
-    return """<?xml version="1.0" encoding="UTF-8"?>
+ENTSOE_A44_RESPONSE = """<?xml version="1.0" encoding="UTF-8"?>
 <Publication_MarketDocument xmlns="urn:iec62325.351:tc57wg16:451-3:publicationdocument:7:0">
     <mRID>test-document-id</mRID>
     <revisionNumber>1</revisionNumber>
@@ -57,6 +56,132 @@ def mock_entsoe_response():
 </Publication_MarketDocument>"""
 
 
+def make_prices(day, eur_per_mwh, slots=24, resolution_minutes=60):
+    """Build `slots` price rows for `day`; eur_per_mwh(position) sets each price"""
+    per_hour = 60 // resolution_minutes
+    rows = []
+    for i in range(1, slots + 1):
+        hour, part = divmod(i - 1, per_hour)
+        eur = eur_per_mwh(i)
+        rows.append(
+            {
+                "position": i,
+                "hour_local": f"{day} {hour:02d}:{part * resolution_minutes:02d}",
+                "eur_per_mwh": eur,
+                "ct_per_kwh": eur / 10,
+                "resolution": f"PT{resolution_minutes}M",
+            }
+        )
+    return rows
+
+
+@pytest.fixture(scope="session")
+def mock_entsoe_response():
+    """Mock ENTSO-E API response for testing"""
+    return ENTSOE_A44_RESPONSE
+
+
+def gl_market_document(quantities, psr_type=None):
+    """GL_MarketDocument with one hourly TimeSeries for 2023-10-28"""
+    psr = (
+        f"<productionType>{psr_type}</productionType><psrType>{psr_type}</psrType>"
+        if psr_type
+        else ""
+    )
+    points = "".join(
+        f"<Point><position>{i}</position><quantity>{q}</quantity></Point>"
+        for i, q in enumerate(quantities, start=1)
+    )
+    return f"""<?xml version="1.0"?>
+<GL_MarketDocument>
+    <TimeSeries>
+        {psr}
+        <Period>
+            <timeInterval>
+                <start>2023-10-27T23:00Z</start>
+                <end>2023-10-28T23:00Z</end>
+            </timeInterval>
+            <resolution>PT60M</resolution>
+            {points}
+        </Period>
+    </TimeSeries>
+</GL_MarketDocument>"""
+
+
+def publication_market_document(prices):
+    """Publication_MarketDocument with one hourly A44 TimeSeries for 2023-10-28"""
+    points = "".join(
+        f"<Point><position>{i}</position><price.amount>{p}</price.amount></Point>"
+        for i, p in enumerate(prices, start=1)
+    )
+    return f"""<?xml version="1.0"?>
+<Publication_MarketDocument>
+    <TimeSeries>
+        <Period>
+            <timeInterval>
+                <start>2023-10-27T23:00Z</start>
+                <end>2023-10-28T23:00Z</end>
+            </timeInterval>
+            <resolution>PT60M</resolution>
+            {points}
+        </Period>
+    </TimeSeries>
+</Publication_MarketDocument>"""
+
+
+@pytest.fixture(scope="session")
+def entsoe_xml_map():
+    """Mocked ENTSO-E responses keyed by documentType (prices, generation, load)"""
+    return {
+        "A44": publication_market_document([45.67, 30.50, 55.20]),
+        "A69": gl_market_document([1500.0, 1600.0], psr_type="B16"),
+        "A65": gl_market_document([12000.0, 11000.0]),
+    }
+
+
+@pytest.fixture
+def mock_entsoe_by_doc_type(mock_requests_get, entsoe_xml_map):
+    """Session.get answering from entsoe_xml_map; unknown types get the load XML"""
+    default_xml = entsoe_xml_map["A65"]
+
+    def respond(*args, **kwargs):
+        doc_type = kwargs.get("params", {}).get("documentType")
+        # Plain stub: much cheaper to build than a Mock per response
+        return SimpleNamespace(
+            status_code=200,
+            encoding="utf-8",
+            headers={},
+            text=entsoe_xml_map.get(doc_type, default_xml),
+        )
+
+    mock_requests_get.side_effect = respond
+    return mock_requests_get
+
+
+@pytest.fixture(scope="session")
+def sample_generation_xml():
+    """A69 generation forecast for a single PSR type (B16, solar)"""
+    return gl_market_document([1500.0, 1600.0], psr_type="B16")
+
+
+@pytest.fixture(scope="session")
+def sample_netpos_xml():
+    """A75 net position document"""
+    return gl_market_document([-500.0, -600.0])
+
+
+@pytest.fixture(scope="session")
+def sample_exchange_xml():
+    """A01 scheduled exchanges document"""
+    return gl_market_document([250.0, 300.0])
+
+
+@pytest.fixture(scope="session")
+def sample_load_xml():
+    """A65 total load document"""
+    return gl_market_document([12000.0, 11500.0])
+
+
 @pytest.fixture
 def sample_price_data():
     """Sample price data for testing"""
@@ -73,8 +198,7 @@ def sample_price_data():
 @pytest.fixture
 def test_dates():
     """Test date ranges"""
-    amsterdam_tz = pytz.timezone("Europe/Amsterdam")
-    today = datetime.now(amsterdam_tz).date()
+    today = datetime.now(AMSTERDAM_TZ).date()
     tomorrow = today + timedelta(days=1)
     return {
         "today": today,
@@ -86,17 +210,50 @@ def test_dates():
 
 @pytest.fixture
 def mock_requests_get():
-    """Mock requests.get for API calls"""
-    with patch("requests.get") as mock_get:
+    """Mock GET requests made through the shared requests.Session"""
+    with patch("requests.Session.get") as mock_get:
         yield mock_get
 
 
+@pytest.fixture(scope="session")
+def price_rows():
+    """Factory for mocked get_day_ahead_prices rows (see make_prices)"""
+    return make_prices
+
+
+@pytest.fixture(scope="session")
+def endpoints():
+    """Paths of the price endpoints"""
+    return SimpleNamespace(
+        dayahead="/energy/prices/dayahead",
+        cheapest_basic="/energy/prices/cheapest-basic",
+        cheapest_advanced="/energy/prices/cheapest-advanced",
+    )
+
+
 @pytest.fixture
-def api_client():
-    """FastAPI test client"""
+def mock_get_prices(monkeypatch):
+    """Replace api_server's day-ahead price lookup with a Mock"""
+    import api_server
+
+    mock = Mock()
+    monkeypatch.setattr(api_server.entsoe, "get_day_ahead_prices", mock)
+    return mock
+
+
+@pytest.fixture(scope="session")
+def app_instance():
+    """FastAPI application, imported once per test session"""
     from api_server import app
 
-    return TestClient(app)
+    return app
+
+
+@pytest.fixture(scope="session")
+def api_client(app_instance):
+    """FastAPI test client shared by the whole session"""
+    with TestClient(app_instance) as client:
+        yield client
 
 
 @pytest.fixture
@@ -127,3 +284,14 @@ def setup_test_env(mock_env_vars, monkeypatch):
     """Automatically set up test environment variables"""
     for key, value in mock_env_vars.items():
         monkeypatch.setenv(key, value)
+
+
+@pytest.fixture(autouse=True)
+def reset_entsoe_caches():
+    """Start every test with empty in-process caches"""
+    import ha_entsoe
+
+    ha_entsoe.clear_memory_cache()
+    yield
+    ha_entsoe.flush_pending_writes()
+    ha_entsoe.clear_memory_cache()
@@ -2,29 +2,64 @@
 Unit tests for api_server.py FastAPI endpoints
 """
 
+import importlib.util
+import json
+import sys
 import pytest
-from datetime import date, datetime, timedelta
+from datetime import date, datetime, timedelta, timezone
 from unittest.mock import patch, Mock
 from fastapi.testclient import TestClient
 
 import api_server
+from api_server import (
+    belongs_to_today,
+    calculate_std_dev,
+    calculate_total_duration,
+    create_metadata,
+    detect_resolution,
+    find_most_expensive_hour,
+    format_time_range,
+    get_day_label,
+    get_rank_icon,
+    group_consecutive_slots,
+    is_past_slot,
+    is_std_dev_relevant,
+    parse_hour_local,
+    repeated_positions,
+    validate_date_string,
+    validate_zone_code,
+)
 from ha_entsoe import EntsoeError, EntsoeServerError
 
-# Use current dates for testing
+try:
+    from orjson import loads as json_loads
+except ImportError:  # orjson is optional, same as in api_server
+    from json import loads as json_loads
+
+# Dates for request payloads, read once at import. api_server reads the clock
+# on every request, so tests that compare against "today" or "tomorrow" as the
+# server sees it call date.today() themselves.
 TODAY = date.today()
 TOMORROW = TODAY + timedelta(days=1)
 VALID_TEST_DATE = TODAY.isoformat()
 VALID_FUTURE_DATE = TOMORROW.isoformat()
 
 
+def get_json(client, url, **kwargs):
+    """GET url and return (status_code, decoded body or None)"""
+    response = client.get(url, **kwargs)
+    return response.status_code, (
+        json_loads(response.content) if response.content else None
+    )
+
+
 class TestRootEndpoint:
     """Test root endpoint"""
 
     def test_root_endpoint(self, api_client):
         """Test root endpoint returns service info"""
-        response = api_client.get("/")
-        assert response.status_code == 200
-        data = response.json()
+        status, data = get_json(api_client, "/")
+        assert status == 200
         assert data["service"] == "ENTSO‑E Home Automation API"
         assert data["version"] == "2.9.0"
         assert "features" in data
@@ -36,9 +71,8 @@ class TestHealthEndpoints:
 
     def test_health_basic(self, api_client):
         """Test basic health endpoint"""
-        response = api_client.get("/system/health")
-        assert response.status_code == 200
-        data = response.json()
+        status, data = get_json(api_client, "/system/health")
+        assert status == 200
         assert data["status"] == "ok"
         assert "current_time_nl" in data
         assert "entsoe_api_key_loaded" in data
@@ -49,169 +83,192 @@ class TestHealthEndpoints:
 class TestPriceEndpoints:
     """Test price-related endpoints"""
 
-    def test_get_dayahead_prices_success(self, api_client):
+    def test_get_dayahead_prices_success(self, api_client, mock_get_prices, endpoints):
         """Test successful day-ahead price retrieval"""
-        with patch("api_server.entsoe.get_day_ahead_prices") as mock_prices:
-            mock_prices.return_value = [
-                {
-                    "position": 1,
-                    "hour_local": f"{VALID_TEST_DATE} 00:00",
-                    "eur_per_mwh": 45.67,
-                    "ct_per_kwh": 4.567,
-                    "resolution": "PT60M",
-                },
-                {
-                    "position": 2,
-                    "hour_local": f"{VALID_TEST_DATE} 01:00",
-                    "eur_per_mwh": 42.34,
-                    "ct_per_kwh": 4.234,
-                    "resolution": "PT60M",
-                },
-            ]
+        mock_get_prices.return_value = [
+            {
+                "position": 1,
+                "hour_local": f"{VALID_TEST_DATE} 00:00",
+                "eur_per_mwh": 45.67,
+                "ct_per_kwh": 4.567,
+                "resolution": "PT60M",
+            },
+            {
+                "position": 2,
+                "hour_local": f"{VALID_TEST_DATE} 01:00",
+                "eur_per_mwh": 42.34,
+                "ct_per_kwh": 4.234,
+                "resolution": "PT60M",
+            },
+        ]
+
+        status, data = get_json(
+            api_client, endpoints.dayahead, params={"date": VALID_TEST_DATE}
+        )
+        assert status == 200
 
-            response = api_client.get(f"/energy/prices/dayahead?date={VALID_TEST_DATE}")
-            assert response.status_code == 200
-            data = response.json()
+        assert data["date"] == VALID_TEST_DATE
+        assert data["zone"] == "10YNL----------L"  # Default zone
+        assert len(data["prices"]) == 2
+        assert data["prices"][0]["eur_per_mwh"] == 45.67
+        assert "metadata" in data
 
-            assert data["date"] == VALID_TEST_DATE
-            assert data["zone"] == "10YNL----------L"  # Default zone
-            assert len(data["prices"]) == 2
-            assert data["prices"][0]["eur_per_mwh"] == 45.67
-            assert "metadata" in data
+    def test_get_dayahead_prices_etag(self, api_client, mock_get_prices, endpoints):
+        """Unchanged prices answer If-None-Match with 304 and no body"""
+        rows = [
+            {
+                "position": 1,
+                "hour_local": f"{VALID_TEST_DATE} 00:00",
+                "eur_per_mwh": 45.67,
+                "ct_per_kwh": 4.567,
+                "resolution": "PT60M",
+            }
+        ]
+        params = {"date": VALID_TEST_DATE}
+        mock_get_prices.return_value = rows
+        first = api_client.get(endpoints.dayahead, params=params)
+        etag = first.headers["etag"]
+        assert etag.startswith('W/"')
+
+        cached = api_client.get(
+            endpoints.dayahead, params=params, headers={"If-None-Match": etag}
+        )
+        assert cached.status_code == 304
+        assert cached.content == b""
+        assert cached.headers["etag"] == etag
+
+        changed = [dict(rows[0], ct_per_kwh=5.0)]
+        mock_get_prices.return_value = changed
+        fresh = api_client.get(
+            endpoints.dayahead, params=params, headers={"If-None-Match": etag}
+        )
+        assert fresh.status_code == 200
+        assert fresh.headers["etag"] != etag
 
-    def test_get_dayahead_prices_with_zone(self, api_client):
+    def test_get_dayahead_prices_with_zone(
+        self, api_client, mock_get_prices, endpoints
+    ):
         """Test day-ahead price retrieval with custom zone"""
-        with patch("api_server.entsoe.get_day_ahead_prices") as mock_prices:
-            mock_prices.return_value = []
+        mock_get_prices.return_value = []
 
-            response = api_client.get(
-                f"/energy/prices/dayahead?date={VALID_TEST_DATE}&zone=10YBE----------2"
-            )
-            assert response.status_code == 200
+        response = api_client.get(
+            endpoints.dayahead,
+            params={"date": VALID_TEST_DATE, "zone": "10YBE----------2"},
+        )
+        assert response.status_code == 200
 
-            # Verify the zone parameter was passed correctly
-            mock_prices.assert_called_once()
-            args, kwargs = mock_prices.call_args
-            assert len(args) >= 2
-            assert args[1] == "10YBE----------2"  # zone parameter
+        # Verify the zone parameter was passed correctly
+        mock_get_prices.assert_called_once()
+        args, kwargs = mock_get_prices.call_args
+        assert len(args) >= 2
+        assert args[1] == "10YBE----------2"  # zone parameter
 
-    def test_get_dayahead_prices_invalid_date(self, api_client):
+    def test_get_dayahead_prices_invalid_date(self, api_client, endpoints):
         """Test day-ahead price retrieval with invalid date format"""
-        response = api_client.get("/energy/prices/dayahead?date=invalid-date")
-        assert response.status_code == 422  # Now returns proper validation error
-        data = response.json()
+        status, data = get_json(
+            api_client, endpoints.dayahead, params={"date": "invalid-date"}
+        )
+        assert status == 422  # Now returns proper validation error
         assert "error" in data
         assert data["error"] == "VALIDATION_ERROR"
         assert "Invalid date format" in data["message"]
         assert "error_id" in data
         assert "timestamp" in data
 
-    def test_get_dayahead_prices_entsoe_error(self, api_client):
+    def test_get_dayahead_prices_entsoe_error(
+        self, api_client, mock_get_prices, endpoints
+    ):
         """Test day-ahead price retrieval when ENTSO-E API fails"""
-        with patch("api_server.entsoe.get_day_ahead_prices") as mock_prices:
-            mock_prices.side_effect = EntsoeServerError("API unavailable")
+        mock_get_prices.side_effect = EntsoeServerError("API unavailable")
 
-            response = api_client.get(f"/energy/prices/dayahead?date={VALID_TEST_DATE}")
-            assert response.status_code == 502
-            data = response.json()
-            assert "error" in data
-            assert "API unavailable" in data["message"]
+        status, data = get_json(
+            api_client, endpoints.dayahead, params={"date": VALID_TEST_DATE}
+        )
+        assert status == 502
+        assert "error" in data
+        assert "API unavailable" in data["message"]
 
-    def test_get_dayahead_prices_default_date(self, api_client):
+    def test_get_dayahead_prices_default_date(
+        self, api_client, mock_get_prices, endpoints
+    ):
         """Test day-ahead prices with default date (tomorrow)"""
-        with patch("api_server.entsoe.get_day_ahead_prices") as mock_prices:
-            mock_prices.return_value = []
-
-            response = api_client.get("/energy/prices/dayahead")
-            assert response.status_code == 200
-            data = response.json()
-
-            # Should use tomorrow's date by default
-            tomorrow = (
-                date.today().replace(day=date.today().day + 1)
-                if date.today().day < 28
-                else date.today().replace(month=date.today().month + 1, day=1)
-            )
-            # Note: This is a simplified check, actual implementation uses timedelta
+        mock_get_prices.return_value = []
+
+        status, data = get_json(api_client, endpoints.dayahead)
+        assert status == 200
+
+        # Should use tomorrow's date by default
+        assert data["date"] == (date.today() + timedelta(days=1)).isoformat()
 
 
 class TestCheapestPricesEndpoint:
     """Test cheapest prices analysis endpoint"""
 
-    def test_analyze_cheapest_prices_success(self, api_client):
+    def test_analyze_cheapest_prices_success(
+        self, api_client, mock_get_prices, endpoints, price_rows
+    ):
         """Test successful cheapest prices analysis"""
         # Use tomorrow's date to ensure slots are in the future
         future_date = VALID_FUTURE_DATE
 
         # Create a full day of mock prices with more variation
-        mock_prices = [
-            {
-                "position": i,
-                "hour_local": f"{future_date} {i-1:02d}:00",
-                "eur_per_mwh": 30.0 + (i % 8) * 5,  # Prices from 30-65 EUR/MWh
-                "ct_per_kwh": 3.0 + (i % 8) * 0.5,  # Prices from 3.0-6.5 ct/kWh
-                "resolution": "PT60M",
-            }
-            for i in range(1, 25)  # 24 hours
-        ]
+        mock_prices = price_rows(future_date, lambda i: 30.0 + (i % 8) * 5)
 
-        with patch("api_server.entsoe.get_day_ahead_prices") as mock_get_prices:
-            mock_get_prices.return_value = mock_prices
+        mock_get_prices.return_value = mock_prices
 
-            response = api_client.get(
-                f"/energy/prices/cheapest-advanced?date={future_date}"
-            )
-            assert response.status_code == 200
-            data = response.json()
-
-            assert data["date"] == future_date
-            assert "time_blocks" in data
-            assert "average_ct_per_kwh" in data
-            assert "avoid_slot" in data
-            assert "metadata" in data
-            assert len(data["time_blocks"]) > 0
-
-    def test_analyze_cheapest_prices_with_parameters(self, api_client):
+        status, data = get_json(
+            api_client, endpoints.cheapest_advanced, params={"date": future_date}
+        )
+        assert status == 200
+
+        assert data["date"] == future_date
+        assert "time_blocks" in data
+        assert "average_ct_per_kwh" in data
+        assert "avoid_slot" in data
+        assert "metadata" in data
+        assert len(data["time_blocks"]) > 0
+
+    def test_analyze_cheapest_prices_with_parameters(
+        self, api_client, mock_get_prices, endpoints, price_rows
+    ):
         """Test cheapest prices analysis with custom parameters"""
-        mock_prices = [
-            {
-                "position": i,
-                "hour_local": f"{VALID_TEST_DATE} {i-1:02d}:00",
-                "eur_per_mwh": 50.0 - i * 2,
-                "ct_per_kwh": 5.0 - i * 0.2,
-                "resolution": "PT60M",
-            }
-            for i in range(1, 25)  # 24 hours
-        ]
-
-        with patch("api_server.entsoe.get_day_ahead_prices") as mock_get_prices:
-            mock_get_prices.return_value = mock_prices
-
-            response = api_client.get(
-                f"/energy/prices/cheapest-advanced?date={VALID_TEST_DATE}&max_blocks=4&max_time_gap=120&max_price_gap=3.0"
-            )
-            assert response.status_code == 200
-            data = response.json()
+        mock_prices = price_rows(VALID_TEST_DATE, lambda i: 50.0 - i * 2)
+
+        mock_get_prices.return_value = mock_prices
+
+        status, data = get_json(
+            api_client,
+            endpoints.cheapest_advanced,
+            params={
+                "date": VALID_TEST_DATE,
+                "max_blocks": 4,
+                "max_time_gap": 120,
+                "max_price_gap": 3.0,
+            },
+        )
+        assert status == 200
 
-            assert "time_blocks" in data
-            assert len(data["time_blocks"]) <= 4
-            assert "config" in data
-            assert data["config"]["max_time_gap_minutes"] == 120
-            assert data["config"]["max_price_gap_ct"] == 3.0
+        assert "time_blocks" in data
+        assert len(data["time_blocks"]) <= 4
+        assert "config" in data
+        assert data["config"]["max_time_gap_minutes"] == 120
+        assert data["config"]["max_price_gap_ct"] == 3.0
 
-    def test_analyze_cheapest_prices_no_data(self, api_client):
+    def test_analyze_cheapest_prices_no_data(
+        self, api_client, mock_get_prices, endpoints
+    ):
         """Test cheapest prices analysis when no price data available"""
-        with patch("api_server.entsoe.get_day_ahead_prices") as mock_get_prices:
-            mock_get_prices.return_value = []
+        mock_get_prices.return_value = []
 
-            response = api_client.get(
-                f"/energy/prices/cheapest-advanced?date={VALID_TEST_DATE}"
-            )
-            assert response.status_code == 404
-            data = response.json()
-            assert "Geen prijsdata beschikbaar" in data["message"]
+        status, data = get_json(
+            api_client, endpoints.cheapest_advanced, params={"date": VALID_TEST_DATE}
+        )
+        assert status == 404
+        assert "Geen prijsdata beschikbaar" in data["message"]
 
-    def test_analyze_cheapest_prices_default_date(self, api_client):
+    def test_analyze_cheapest_prices_default_date(
+        self, api_client, mock_get_prices, endpoints
+    ):
         """Test cheapest prices analysis with default date (today)"""
         mock_prices = [
             {
@@ -223,279 +280,242 @@ class TestCheapestPricesEndpoint:
             }
         ]
 
-        with patch("api_server.entsoe.get_day_ahead_prices") as mock_get_prices:
-            mock_get_prices.return_value = mock_prices
-
-            response = api_client.get("/energy/prices/cheapest-advanced")
-            assert response.status_code == 200
-            data = response.json()
-
-            # Should use today's date by default
-            assert "date" in data
-            assert "time_blocks" in data
-
-    def test_cheapest_basic_success(self, api_client):
+        mock_get_prices.return_value = mock_prices
+
+        status, data = get_json(api_client, endpoints.cheapest_advanced)
+        assert status == 200
+
+        # Should use today's date by default
+        assert "date" in data
+        assert "time_blocks" in data
+
+    @pytest.mark.parametrize(
+        "eur_per_mwh, slots, resolution_minutes, query, expected",
+        [
+            pytest.param(
+                lambda i: 50.0 + i,
+                24,
+                60,
+                {"hours": 4},
+                {"hours_requested": 4, "hours_found": 4},
+                id="success",
+            ),
+            pytest.param(
+                lambda i: 50.0 + (i % 3),
+                24,
+                60,
+                {"hours": 3, "consecutive": "true"},
+                {"consecutive_required": True},
+                id="consecutive",
+            ),
+            # No 4 consecutive hours share a price: falls back to single hours
+            pytest.param(
+                lambda i: 50.0 + (i * 10),
+                24,
+                60,
+                {"hours": 4, "consecutive": "true"},
+                {},
+                id="no-consecutive-fallback",
+            ),
+            pytest.param(
+                lambda i: 50.0 + i,
+                96,
+                15,
+                {"hours": 4},
+                {"resolution_minutes": 15},
+                id="15min-resolution",
+            ),
+        ],
+    )
+    def test_cheapest_basic(
+        self,
+        api_client,
+        mock_get_prices,
+        eur_per_mwh,
+        slots,
+        resolution_minutes,
+        query,
+        expected,
+        endpoints,
+        price_rows,
+    ):
         """Test basic cheapest hours endpoint"""
-        mock_prices = [
-            {
-                "position": i,
-                "hour_local": f"{VALID_TEST_DATE} {i-1:02d}:00",
-                "eur_per_mwh": 50.0 + i,
-                "ct_per_kwh": 5.0 + i * 0.1,
-                "resolution": "PT60M",
-            }
-            for i in range(1, 25)  # 24 hours
-        ]
-
-        with patch("api_server.entsoe.get_day_ahead_prices") as mock_get_prices:
-            mock_get_prices.return_value = mock_prices
-
-            response = api_client.get(
-                f"/energy/prices/cheapest-basic?date={VALID_TEST_DATE}&hours=4"
-            )
-            assert response.status_code == 200
-            data = response.json()
-
-            assert data["date"] == VALID_TEST_DATE
-            assert data["hours_requested"] == 4
-            assert data["hours_found"] == 4
-            assert len(data["cheapest_hours"]) == 4
-            assert "statistics" in data
-            assert "future_hours_count" in data
-
-    def test_cheapest_basic_consecutive(self, api_client):
-        """Test basic cheapest hours with consecutive requirement"""
-        mock_prices = [
-            {
-                "position": i,
-                "hour_local": f"{VALID_TEST_DATE} {i-1:02d}:00",
-                "eur_per_mwh": 50.0 + (i % 3),  # Create pattern for consecutive slots
-                "ct_per_kwh": 5.0 + (i % 3) * 0.1,
-                "resolution": "PT60M",
-            }
-            for i in range(1, 25)  # 24 hours
-        ]
-
-        with patch("api_server.entsoe.get_day_ahead_prices") as mock_get_prices:
-            mock_get_prices.return_value = mock_prices
-
-            response = api_client.get(
-                f"/energy/prices/cheapest-basic?date={VALID_TEST_DATE}&hours=3&consecutive=true"
-            )
-            assert response.status_code == 200
-            data = response.json()
-
-            assert data["consecutive_required"] is True
-            assert len(data["cheapest_hours"]) == 3
-
-    def test_cheapest_basic_no_consecutive_fallback(self, api_client):
-        """Test basic cheapest hours fallback when no consecutive block found"""
-        # Create prices where no 4 consecutive hours exist with same price
-        mock_prices = [
-            {
-                "position": i,
-                "hour_local": f"{VALID_TEST_DATE} {i-1:02d}:00",
-                "eur_per_mwh": 50.0 + (i * 10),  # Very different prices
-                "ct_per_kwh": 5.0 + i,
-                "resolution": "PT60M",
-            }
-            for i in range(1, 25)  # 24 hours
-        ]
-
-        with patch("api_server.entsoe.get_day_ahead_prices") as mock_get_prices:
-            mock_get_prices.return_value = mock_prices
-
-            response = api_client.get(
-                f"/energy/prices/cheapest-basic?date={VALID_TEST_DATE}&hours=4&consecutive=true"
-            )
-            assert response.status_code == 200
-            data = response.json()
-
-            # Should fallback to individual cheapest hours
-            assert len(data["cheapest_hours"]) == 4
-
-    def test_cheapest_basic_15min_resolution(self, api_client):
-        """Test basic cheapest hours with 15-minute resolution"""
-        mock_prices = [
-            {
-                "position": i,
-                "hour_local": f"{VALID_TEST_DATE} {(i-1)//4:02d}:{((i-1)%4)*15:02d}",
-                "eur_per_mwh": 50.0 + i,
-                "ct_per_kwh": 5.0 + i * 0.1,
-                "resolution": "PT15M",
-            }
-            for i in range(1, 97)  # 96 15-minute slots
-        ]
-
-        with patch("api_server.entsoe.get_day_ahead_prices") as mock_get_prices:
-            mock_get_prices.return_value = mock_prices
+        mock_get_prices.return_value = price_rows(
+            VALID_TEST_DATE,
+            eur_per_mwh,
+            slots=slots,
+            resolution_minutes=resolution_minutes,
+        )
 
-            response = api_client.get(
-                f"/energy/prices/cheapest-basic?date={VALID_TEST_DATE}&hours=4"
-            )
-            assert response.status_code == 200
-            data = response.json()
+        status, data = get_json(
+            api_client,
+            endpoints.cheapest_basic,
+            params={"date": VALID_TEST_DATE, **query},
+        )
+        assert status == 200
 
-            assert data["resolution_minutes"] == 15
-            assert len(data["cheapest_hours"]) == 4
+        assert data["date"] == VALID_TEST_DATE
+        assert len(data["cheapest_hours"]) == query["hours"]
+        assert "statistics" in data
+        assert "future_hours_count" in data
+        for key, value in expected.items():
+            assert data[key] == value
 
-    def test_cheapest_basic_no_data(self, api_client):
+    def test_cheapest_basic_no_data(self, api_client, mock_get_prices, endpoints):
         """Test basic cheapest hours when no data available"""
-        with patch("api_server.entsoe.get_day_ahead_prices") as mock_get_prices:
-            mock_get_prices.return_value = []
+        mock_get_prices.return_value = []
 
-            response = api_client.get(
-                f"/energy/prices/cheapest-basic?date={VALID_TEST_DATE}"
-            )
-            assert response.status_code == 404
-            data = response.json()
-            assert "Geen prijsdata beschikbaar" in data["message"]
+        status, data = get_json(
+            api_client, endpoints.cheapest_basic, params={"date": VALID_TEST_DATE}
+        )
+        assert status == 404
+        assert "Geen prijsdata beschikbaar" in data["message"]
 
-    def test_cheapest_advanced_fallback_scenarios(self, api_client):
+    def test_cheapest_advanced_fallback_scenarios(
+        self, api_client, mock_get_prices, endpoints, price_rows
+    ):
         """Test advanced endpoint fallback scenarios"""
         # Create minimal data to trigger fallback logic
-        mock_prices = [
-            {
-                "position": i,
-                "hour_local": f"{VALID_TEST_DATE} {i-1:02d}:00",
-                "eur_per_mwh": 50.0 + i * 5,  # Large price differences
-                "ct_per_kwh": 5.0 + i * 0.5,
-                "resolution": "PT60M",
-            }
-            for i in range(1, 6)  # Only 5 hours to trigger fallback
-        ]
+        # Only 5 hours to trigger fallback
+        mock_prices = price_rows(VALID_TEST_DATE, lambda i: 50.0 + i * 5, slots=5)
 
-        with patch("api_server.entsoe.get_day_ahead_prices") as mock_get_prices:
-            mock_get_prices.return_value = mock_prices
+        mock_get_prices.return_value = mock_prices
 
-            response = api_client.get(
-                f"/energy/prices/cheapest-advanced?date={VALID_TEST_DATE}&max_blocks=6&max_price_gap=1.0"
-            )
-            assert response.status_code == 200
-            data = response.json()
+        status, data = get_json(
+            api_client,
+            endpoints.cheapest_advanced,
+            params={"date": VALID_TEST_DATE, "max_blocks": 6, "max_price_gap": 1.0},
+        )
+        assert status == 200
 
-            # Should have fallback info when price gap was adjusted
-            if "fallback_info" in data:
-                assert data["fallback_info"]["applied"] is True
-                assert "adjusted_price_gap" in data["fallback_info"]
+        # Should have fallback info when price gap was adjusted
+        if "fallback_info" in data:
+            assert data["fallback_info"]["applied"] is True
+            assert "adjusted_price_gap" in data["fallback_info"]
 
 
 class TestErrorHandling:
     """Test error handling across endpoints"""
 
-    def test_entsoe_server_error_handling(self, api_client):
+    def test_entsoe_server_error_handling(self, api_client, mock_get_prices, endpoints):
         """Test that ENTSO-E server errors are properly formatted"""
-        with patch("api_server.entsoe.get_day_ahead_prices") as mock_prices:
-            error = EntsoeServerError("Test server error", status=502)
-            mock_prices.side_effect = error
+        error = EntsoeServerError("Test server error", status=502)
+        mock_get_prices.side_effect = error
 
-            response = api_client.get(f"/energy/prices/dayahead?date={VALID_TEST_DATE}")
-            assert response.status_code == 502
-            data = response.json()
+        status, data = get_json(
+            api_client, endpoints.dayahead, params={"date": VALID_TEST_DATE}
+        )
+        assert status == 502
 
-            assert "error" in data
-            assert "Test server error" in data["message"]
+        assert "error" in data
+        assert "Test server error" in data["message"]
 
-    def test_entsoe_client_error_handling(self, api_client):
+    def test_entsoe_client_error_handling(self, api_client, mock_get_prices, endpoints):
         """Test that ENTSO-E client errors are properly formatted"""
-        with patch("api_server.entsoe.get_day_ahead_prices") as mock_prices:
-            error = EntsoeError("Test client error", status=400, code="BAD_REQUEST")
-            mock_prices.side_effect = error
+        error = EntsoeError("Test client error", status=400, code="BAD_REQUEST")
+        mock_get_prices.side_effect = error
 
-            response = api_client.get(f"/energy/prices/dayahead?date={VALID_TEST_DATE}")
-            assert response.status_code == 400
-            data = response.json()
+        status, data = get_json(
+            api_client, endpoints.dayahead, params={"date": VALID_TEST_DATE}
+        )
+        assert status == 400
 
-            assert data["error"] == "BAD_REQUEST"
-            assert "Test client error" in data["message"]
+        assert data["error"] == "BAD_REQUEST"
+        assert "Test client error" in data["message"]
 
-    def test_generic_exception_handling(self, api_client):
+    def test_generic_exception_handling(self, api_client, mock_get_prices, endpoints):
         """Test handling of unexpected exceptions"""
-        with patch("api_server.entsoe.get_day_ahead_prices") as mock_prices:
-            mock_prices.side_effect = ValueError("Unexpected error")
+        mock_get_prices.side_effect = ValueError("Unexpected error")
 
-            response = api_client.get(f"/energy/prices/dayahead?date={VALID_TEST_DATE}")
-            assert response.status_code == 500  # Generic exceptions return 500
-            data = response.json()
+        status, data = get_json(
+            api_client, endpoints.dayahead, params={"date": VALID_TEST_DATE}
+        )
+        assert status == 500  # Generic exceptions return 500
 
-            assert "error" in data
-            assert "Unexpected error" in data["message"]
+        assert "error" in data
+        assert "Unexpected error" in data["message"]
 
     def test_404_for_nonexistent_endpoint(self, api_client):
         """Test that non-existent endpoints return 404"""
         response = api_client.get("/nonexistent/endpoint")
         assert response.status_code == 404
 
-    def test_debug_mode_traceback(self, api_client):
+    def test_debug_mode_traceback(self, api_client, mock_get_prices, endpoints):
         """Test that debug mode includes traceback in error responses"""
         with patch("api_server.LOG_LEVEL", "DEBUG"):
-            with patch("api_server.entsoe.get_day_ahead_prices") as mock_prices:
-                mock_prices.side_effect = RuntimeError("Test error")
-
-                response = api_client.get(
-                    f"/energy/prices/dayahead?date={VALID_TEST_DATE}"
-                )
-                assert response.status_code == 500
-                data = response.json()
+            mock_get_prices.side_effect = RuntimeError("Test error")
 
-                assert "error" in data
-                # In debug mode, traceback should be included
-                assert "traceback" in data
+            status, data = get_json(
+                api_client, endpoints.dayahead, params={"date": VALID_TEST_DATE}
+            )
+            assert status == 500
 
-    def test_date_validation_errors(self, api_client):
+            assert "error" in data
+            # In debug mode, traceback should be included
+            assert "traceback" in data
+
+    @pytest.mark.parametrize(
+        "date_str, expected_status, expected_message",
+        [
+            pytest.param("invalid-date", 422, "Invalid date format", id="invalid"),
+            # Dates out of range currently return 500, not 422
+            pytest.param(
+                (TODAY - timedelta(days=400)).isoformat(),
+                500,
+                "too far in the past",
+                id="too-old",
+            ),
+            pytest.param(
+                (TODAY + timedelta(days=30)).isoformat(),
+                500,
+                "too far in the future",
+                id="too-far-ahead",
+            ),
+        ],
+    )
+    def test_date_validation_errors(
+        self, api_client, date_str, expected_status, expected_message, endpoints
+    ):
         """Test various date validation error scenarios"""
-        # Test invalid date format
-        response = api_client.get("/energy/prices/dayahead?date=invalid-date")
-        assert response.status_code == 422
-        data = response.json()
-        assert "VALIDATION_ERROR" in data["error"]
-        assert "Invalid date format" in data["message"]
-
-        # Test date too far in past - this currently returns 500, not 422
-        old_date = (date.today() - timedelta(days=400)).isoformat()
-        response = api_client.get(f"/energy/prices/dayahead?date={old_date}")
-        assert response.status_code == 500  # Current behavior
-        data = response.json()
-        assert "too far in the past" in data["message"]
-
-        # Test date too far in future - this currently returns 500, not 422
-        future_date = (date.today() + timedelta(days=30)).isoformat()
-        response = api_client.get(f"/energy/prices/dayahead?date={future_date}")
-        assert response.status_code == 500  # Current behavior
-        data = response.json()
-        assert "too far in the future" in data["message"]
-
-    def test_zone_validation_errors(self, api_client):
-        """Test zone validation error scenarios"""
-        # Note: Zone validation is not currently implemented in the endpoint
-        # Invalid zones are passed to the API and return 401 errors
-
-        # Test invalid zone length - goes to API and gets 401
-        response = api_client.get(
-            f"/energy/prices/dayahead?date={VALID_TEST_DATE}&zone=INVALID"
+        status, data = get_json(
+            api_client, endpoints.dayahead, params={"date": date_str}
         )
-        assert response.status_code == 401  # Current behavior - API rejects it
-        data = response.json()
-        assert "UNAUTHORIZED" in data["error"]
+        assert status == expected_status
+        assert expected_message in data["message"]
+        if status == 422:
+            assert "VALIDATION_ERROR" in data["error"]
 
-        # Test invalid zone format - also goes to API and gets 401
-        response = api_client.get(
-            f"/energy/prices/dayahead?date={VALID_TEST_DATE}&zone=ABCDEFGHIJKLMNOP"
+    # Note: Zone validation is not currently implemented in the endpoint.
+    # Invalid zones are passed to the API and return 401 errors.
+    @pytest.mark.parametrize(
+        "zone",
+        [
+            pytest.param("INVALID", id="invalid-length"),
+            pytest.param("ABCDEFGHIJKLMNOP", id="invalid-format"),
+        ],
+    )
+    def test_zone_validation_errors(self, api_client, zone, endpoints):
+        """Test zone validation error scenarios"""
+        status, data = get_json(
+            api_client,
+            endpoints.dayahead,
+            params={"date": VALID_TEST_DATE, "zone": zone},
         )
-        assert response.status_code == 401  # Current behavior - API rejects it
-        data = response.json()
+        assert status == 401  # Current behavior - API rejects it
         assert "UNAUTHORIZED" in data["error"]
 
-    def test_middleware_exception_handling(self, api_client):
+    def test_middleware_exception_handling(
+        self, api_client, mock_get_prices, endpoints
+    ):
         """Test middleware exception handling"""
-        with patch("api_server.entsoe.get_day_ahead_prices") as mock_prices:
-            # Test ValueError in middleware (date parsing)
-            mock_prices.side_effect = ValueError("Invalid isoformat string")
+        # Test ValueError in middleware (date parsing)
+        mock_get_prices.side_effect = ValueError("Invalid isoformat string")
 
-            response = api_client.get(f"/energy/prices/dayahead?date={VALID_TEST_DATE}")
-            assert response.status_code == 422
-            data = response.json()
-            assert "VALIDATION_ERROR" in data["error"]
+        status, data = get_json(
+            api_client, endpoints.dayahead, params={"date": VALID_TEST_DATE}
+        )
+        assert status == 422
+        assert "VALIDATION_ERROR" in data["error"]
 
     def test_import_error_handling(self):
         """Test import error handling for ha_entsoe module"""
@@ -505,67 +525,58 @@ class TestErrorHandling:
 
         assert hasattr(api_server, "entsoe")
 
-    def test_dotenv_import_error_handling(self):
-        """Test dotenv import error handling"""
-        # Test that the code handles missing dotenv gracefully
-        with patch(
-            "builtins.__import__", side_effect=ImportError("No module named 'dotenv'")
-        ):
-            # This would normally be tested at import time, but we can verify the pattern
-            try:
-                from dotenv import load_dotenv
+    def test_dotenv_import_error_handling(self, monkeypatch):
+        """api_server imports fine when python-dotenv is not installed"""
+        # A None entry makes `from dotenv import ...` raise ImportError
+        monkeypatch.setitem(sys.modules, "dotenv", None)
+
+        # Execute a fresh copy so the shared api_server module stays untouched
+        spec = importlib.util.find_spec("api_server")
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
 
-                load_dotenv()
-            except Exception:
-                pass  # Should handle gracefully
+        assert module.app.title == api_server.app.title
 
 
 @pytest.mark.integration
 class TestEndToEndScenarios:
     """Test complete end-to-end scenarios"""
 
-    def test_full_price_analysis_workflow(self, api_client):
+    def test_full_price_analysis_workflow(
+        self, api_client, mock_get_prices, endpoints, price_rows
+    ):
         """Test complete price analysis workflow"""
         # Mock price data for a full day
-        mock_prices = [
-            {
-                "position": i,
-                "hour_local": f"{VALID_TEST_DATE} {i-1:02d}:00",
-                "eur_per_mwh": 50.0 + (i % 6) * 10,  # Varying prices
-                "ct_per_kwh": 5.0 + (i % 6),
-                "resolution": "PT60M",
-            }
-            for i in range(1, 25)  # 24 hours
-        ]
+        mock_prices = price_rows(VALID_TEST_DATE, lambda i: 50.0 + (i % 6) * 10)
 
-        with patch("api_server.entsoe.get_day_ahead_prices") as mock_get_prices:
-            mock_get_prices.return_value = mock_prices
+        mock_get_prices.return_value = mock_prices
 
-            # 1. Get raw prices
-            prices_response = api_client.get(
-                f"/energy/prices/dayahead?date={VALID_TEST_DATE}"
-            )
-            assert prices_response.status_code == 200
+        # 1. Get raw prices
+        prices_response = api_client.get(
+            endpoints.dayahead, params={"date": VALID_TEST_DATE}
+        )
+        assert prices_response.status_code == 200
 
-            # 2. Analyze prices
-            analysis_response = api_client.get(
-                f"/energy/prices/cheapest-advanced?date={VALID_TEST_DATE}&max_blocks=4"
-            )
-            assert analysis_response.status_code == 200
+        # 2. Analyze prices
+        analysis_response = api_client.get(
+            endpoints.cheapest_advanced,
+            params={"date": VALID_TEST_DATE, "max_blocks": 4},
+        )
+        assert analysis_response.status_code == 200
 
-            analysis_data = analysis_response.json()
-            assert len(analysis_data["time_blocks"]) <= 4
+        analysis_data = analysis_response.json()
+        assert len(analysis_data["time_blocks"]) <= 4
 
-            # 3. Verify analysis makes sense
-            if analysis_data["time_blocks"]:
-                cheapest_prices = [
-                    block["avg_price"] for block in analysis_data["time_blocks"]
-                ]
-                assert all(
-                    price <= 10.0 for price in cheapest_prices
-                )  # Should be relatively cheap
+        # 3. Verify analysis makes sense
+        if analysis_data["time_blocks"]:
+            cheapest_prices = [
+                block["avg_price"] for block in analysis_data["time_blocks"]
+            ]
+            assert all(
+                price <= 10.0 for price in cheapest_prices
+            )  # Should be relatively cheap
 
-    def test_multi_zone_comparison(self, api_client):
+    def test_multi_zone_comparison(self, api_client, mock_get_prices, endpoints):
         """Test comparing prices across different zones"""
         mock_nl_prices = [
             {
@@ -586,36 +597,34 @@ class TestEndToEndScenarios:
             }
         ]
 
-        def mock_prices_side_effect(date_obj, zone, **kwargs):
-            if zone == "10YNL----------L":
-                return mock_nl_prices
-            elif zone == "10YBE----------2":
-                return mock_be_prices
-            else:
-                return []
-
-        with patch(
-            "api_server.entsoe.get_day_ahead_prices",
-            side_effect=mock_prices_side_effect,
-        ):
-            # Get prices for Netherlands
-            nl_response = api_client.get(
-                f"/energy/prices/dayahead?date={VALID_TEST_DATE}&zone=10YNL----------L"
-            )
-            assert nl_response.status_code == 200
+        zone_prices = {
+            "10YNL----------L": mock_nl_prices,
+            "10YBE----------2": mock_be_prices,
+        }
+        mock_get_prices.side_effect = lambda d, zone, **kwargs: zone_prices.get(
+            zone, []
+        )
 
-            # Get prices for Belgium
-            be_response = api_client.get(
-                f"/energy/prices/dayahead?date={VALID_TEST_DATE}&zone=10YBE----------2"
-            )
-            assert be_response.status_code == 200
+        # Get prices for Netherlands
+        nl_response = api_client.get(
+            endpoints.dayahead,
+            params={"date": VALID_TEST_DATE, "zone": "10YNL----------L"},
+        )
+        assert nl_response.status_code == 200
 
-            # Compare results
-            nl_data = nl_response.json()
-            be_data = be_response.json()
+        # Get prices for Belgium
+        be_response = api_client.get(
+            endpoints.dayahead,
+            params={"date": VALID_TEST_DATE, "zone": "10YBE----------2"},
+        )
+        assert be_response.status_code == 200
+
+        # Compare results
+        nl_data = nl_response.json()
+        be_data = be_response.json()
 
-            assert nl_data["prices"][0]["ct_per_kwh"] == 5.0
-            assert be_data["prices"][0]["ct_per_kwh"] == 4.5
+        assert nl_data["prices"][0]["ct_per_kwh"] == 5.0
+        assert be_data["prices"][0]["ct_per_kwh"] == 4.5
 
     def test_service_info_and_health_check(self, api_client):
         """Test service info and health check workflow"""
@@ -641,10 +650,24 @@ class TestEndToEndScenarios:
 class TestUtilityFunctions:
     """Test utility functions and helper methods"""
 
+    def test_parse_hour_local(self):
+        """Slot timestamps parse like strptime('%Y-%m-%d %H:%M')"""
+        assert parse_hour_local("2023-10-28 13:45") == datetime(2023, 10, 28, 13, 45)
+        for bad in ("invalid", "2023-10-28", "2023-10-28 13:45:00", "2023-10-28 25:00"):
+            with pytest.raises(ValueError):
+                parse_hour_local(bad)
+
+    def test_orjson_response_matches_json(self):
+        """With orjson installed, responses render the same JSON via ORJSONResponse"""
+        pytest.importorskip("orjson")
+        from fastapi.responses import ORJSONResponse
+
+        content = {"date": "2023-10-28", "prices": [{"position": 1, "ct": 4.567}]}
+        assert json.loads(ORJSONResponse(content).body) == content
+        assert api_server.app.router.default_response_class is ORJSONResponse
+
     def test_validate_date_string_edge_cases(self):
         """Test date validation edge cases"""
-        from api_server import validate_date_string
-
         # Test empty string
         with pytest.raises(ValueError, match="Date parameter is required"):
             validate_date_string("")
@@ -659,8 +682,6 @@ class TestUtilityFunctions:
 
     def test_validate_zone_code_edge_cases(self):
         """Test zone code validation edge cases"""
-        from api_server import validate_zone_code
-
         # Test empty string
         with pytest.raises(ValueError, match="Zone parameter is required"):
             validate_zone_code("")
@@ -671,8 +692,6 @@ class TestUtilityFunctions:
 
     def test_calculate_std_dev(self):
         """Test standard deviation calculation"""
-        from api_server import calculate_std_dev
-
         # Test with less than 2 values
         assert calculate_std_dev([]) == 0.0
         assert calculate_std_dev([5.0]) == 0.0
@@ -686,8 +705,6 @@ class TestUtilityFunctions:
 
     def test_is_std_dev_relevant(self):
         """Test standard deviation relevance check"""
-        from api_server import is_std_dev_relevant
-
         # Test with too few slots
         assert is_std_dev_relevant(1.0, 5.0, 2) is False
 
@@ -700,66 +717,70 @@ class TestUtilityFunctions:
         # Test with relevant std dev
         assert is_std_dev_relevant(1.0, 5.0, 5) is True
 
-    def test_get_rank_icon(self):
+    @pytest.mark.parametrize(
+        "rank, icon",
+        [(1, "🥇"), (2, "🥈"), (3, "🥉"), (4, "4️⃣"), (10, "🔟"), (11, "#11")],
+    )
+    def test_get_rank_icon(self, rank, icon):
         """Test rank icon generation"""
-        from api_server import get_rank_icon
-
-        assert get_rank_icon(1) == "🥇"
-        assert get_rank_icon(2) == "🥈"
-        assert get_rank_icon(3) == "🥉"
-        assert get_rank_icon(4) == "4️⃣"
-        assert get_rank_icon(10) == "🔟"
-        assert get_rank_icon(11) == "#11"
-
-    def test_belongs_to_today(self):
+        assert get_rank_icon(rank) == icon
+
+    @pytest.mark.parametrize(
+        "hour_local, expected",
+        [
+            # Early morning hours are considered "early tomorrow"
+            ("2023-10-28 02:00", False),
+            ("2023-10-28 05:00", False),
+            # Normal day hours
+            ("2023-10-28 06:00", True),
+            ("2023-10-28 12:00", True),
+            ("2023-10-28 23:00", True),
+            # Invalid format falls back to True
+            ("invalid", True),
+        ],
+    )
+    def test_belongs_to_today(self, hour_local, expected):
         """Test belongs_to_today function"""
-        from api_server import belongs_to_today
-
-        # Test early morning hours (should be considered "early tomorrow")
-        assert belongs_to_today("2023-10-28 02:00") is False
-        assert belongs_to_today("2023-10-28 05:00") is False
-
-        # Test normal day hours
-        assert belongs_to_today("2023-10-28 06:00") is True
-        assert belongs_to_today("2023-10-28 12:00") is True
-        assert belongs_to_today("2023-10-28 23:00") is True
-
-        # Test invalid format (should return True as fallback)
-        assert belongs_to_today("invalid") is True
-
-    def test_detect_resolution(self):
+        assert belongs_to_today(hour_local) is expected
+
+    @pytest.mark.parametrize(
+        "slots, expected",
+        [
+            pytest.param([], 60, id="empty"),
+            pytest.param([{"position": 1}], 60, id="single-slot"),
+            pytest.param(
+                [
+                    {"resolution": "PT15M", "hour_local": "2023-10-28 00:00"},
+                    {"resolution": "PT15M", "hour_local": "2023-10-28 00:15"},
+                ],
+                15,
+                id="PT15M",
+            ),
+            pytest.param(
+                [
+                    {"resolution": "PT60M", "hour_local": "2023-10-28 00:00"},
+                    {"resolution": "PT60M", "hour_local": "2023-10-28 01:00"},
+                ],
+                60,
+                id="PT60M",
+            ),
+            # Fallback calculation from the time difference
+            pytest.param(
+                [
+                    {"hour_local": "2023-10-28 00:00"},
+                    {"hour_local": "2023-10-28 00:15"},
+                ],
+                15,
+                id="from-time-difference",
+            ),
+        ],
+    )
+    def test_detect_resolution(self, slots, expected):
         """Test resolution detection"""
-        from api_server import detect_resolution
-
-        # Test empty slots
-        assert detect_resolution([]) == 60
-        assert detect_resolution([{"position": 1}]) == 60  # Single slot
-
-        # Test PT15M resolution
-        slots_15m = [
-            {"resolution": "PT15M", "hour_local": "2023-10-28 00:00"},
-            {"resolution": "PT15M", "hour_local": "2023-10-28 00:15"},
-        ]
-        assert detect_resolution(slots_15m) == 15
-
-        # Test PT60M resolution
-        slots_60m = [
-            {"resolution": "PT60M", "hour_local": "2023-10-28 00:00"},
-            {"resolution": "PT60M", "hour_local": "2023-10-28 01:00"},
-        ]
-        assert detect_resolution(slots_60m) == 60
-
-        # Test fallback calculation from time difference
-        slots_calc = [
-            {"hour_local": "2023-10-28 00:00"},
-            {"hour_local": "2023-10-28 00:15"},
-        ]
-        assert detect_resolution(slots_calc) == 15
+        assert detect_resolution(slots) == expected
 
     def test_format_time_range(self):
         """Test time range formatting"""
-        from api_server import format_time_range
-
         # Test 60-minute resolution
         result = format_time_range("2023-10-28 10:00", "2023-10-28 12:00", 60)
         assert result == "10:00 - 13:00"  # End time should be 12:00 + 60min
@@ -774,8 +795,6 @@ class TestUtilityFunctions:
 
     def test_calculate_total_duration(self):
         """Test total duration calculation"""
-        from api_server import calculate_total_duration
-
         # Test empty positions
         assert calculate_total_duration([], 60) == 0
 
@@ -785,9 +804,6 @@ class TestUtilityFunctions:
 
     def test_get_day_label(self):
         """Test day label generation"""
-        from api_server import get_day_label
-        from datetime import date, timedelta
-
         today = date.today()
         tomorrow = today + timedelta(days=1)
 
@@ -801,8 +817,6 @@ class TestUtilityFunctions:
 
     def test_create_metadata(self):
         """Test metadata creation"""
-        from api_server import create_metadata
-
         metadata = create_metadata("test_endpoint", {"param": "value"})
 
         assert metadata["endpoint"] == "test_endpoint"
@@ -816,9 +830,6 @@ class TestUtilityFunctions:
 
     def test_is_past_slot_edge_cases(self):
         """Test is_past_slot edge cases"""
-        from api_server import is_past_slot
-        from datetime import date, timedelta
-
         today = date.today()
         yesterday = today - timedelta(days=1)
         tomorrow = today + timedelta(days=1)
@@ -832,13 +843,37 @@ class TestUtilityFunctions:
         # Test invalid timestamp (should return False)
         assert is_past_slot("invalid", today, 60) is False
 
+    def test_is_past_slot_autumn_dst(self, monkeypatch):
+        """The repeated 02:00 hour on the last Sunday of October is judged in UTC"""
+        day = date(2025, 10, 26)
+        # 02:30 CET: the second pass of the repeated hour (01:30 UTC)
+        frozen = datetime(2025, 10, 26, 1, 30, tzinfo=timezone.utc)
+
+        class FrozenDatetime(datetime):
+            @classmethod
+            def now(cls, tz=None):
+                return frozen.astimezone(tz)
+
+        monkeypatch.setattr(api_server, "datetime", FrozenDatetime)
+
+        # First pass (02:00-03:00 CEST) ended at 01:00 UTC
+        assert is_past_slot("2025-10-26 02:00", day, 60) is True
+        # Second pass (02:00-03:00 CET) is still running
+        assert is_past_slot("2025-10-26 02:00", day, 60, fold=1) is False
+        assert is_past_slot("2025-10-26 03:00", day, 60) is False
+
+        # 25 hourly rows: positions 3 and 4 are both "02:00"
+        hours = [0, 1, 2, 2] + list(range(3, 24))
+        rows = [
+            {"position": i, "hour_local": f"2025-10-26 {h:02d}:00"}
+            for i, h in enumerate(hours, start=1)
+        ]
+        assert repeated_positions(rows) == {4}
+
     def test_find_most_expensive_hour_edge_cases(self):
         """Test find_most_expensive_hour edge cases"""
-        from api_server import find_most_expensive_hour
-        from datetime import date
-
         # Test empty slots
-        result = find_most_expensive_hour([], date.today(), 60)
+        result = find_most_expensive_hour([], TODAY, 60)
         assert result is None
 
         # Test with no future slots (all past)
@@ -850,13 +885,30 @@ class TestUtilityFunctions:
             }
         ]
         with patch("api_server.is_current_or_future_slot", return_value=False):
-            result = find_most_expensive_hour(past_slots, date.today(), 60)
+            result = find_most_expensive_hour(past_slots, TODAY, 60)
             assert result is None
 
+    def test_find_most_expensive_hour_skips_windows_with_gaps(self):
+        """PT15M windows spanning a missing position are not considered"""
+        prices = {1: 5.0, 2: 5.0, 3: 5.0, 4: 5.0, 6: 30.0, 7: 30.0, 8: 30.0, 10: 30.0}
+        slots = [
+            {
+                "position": pos,
+                "hour_local": f"2023-10-28 {(pos - 1) // 4:02d}:{(pos - 1) % 4 * 15:02d}",
+                "ct_per_kwh": price,
+            }
+            for pos, price in prices.items()
+        ]
+
+        result = find_most_expensive_hour(slots, date(2023, 10, 28), 15)
+
+        # 6..10 is missing position 9; the only gap-free window is 1..4
+        assert [s["position"] for s in result["slots"]] == [1, 2, 3, 4]
+        assert result["avg_price"] == 5.0
+        assert result["duration_minutes"] == 60
+
     def test_group_consecutive_slots_edge_cases(self):
         """Test group_consecutive_slots edge cases"""
-        from api_server import group_consecutive_slots
-
         # Test empty slots
         result = group_consecutive_slots([])
         assert result == []
@@ -0,0 +1,63 @@
+"""
+Benchmarks for the hot API endpoints (pytest-benchmark)
+
+Run with: pytest tests/test_benchmarks.py --benchmark-only --no-cov -p no:xdist
+"""
+
+from datetime import date, timedelta
+
+import pytest
+
+pytest.importorskip("pytest_benchmark")
+
+BENCH_DATE = (date.today() + timedelta(days=1)).isoformat()
+
+ROWS = {
+    "PT60M": dict(eur_per_mwh=lambda i: 30.0 + (i % 8) * 5),
+    "PT15M": dict(
+        eur_per_mwh=lambda i: 30.0 + (i % 12) * 2.5, slots=96, resolution_minutes=15
+    ),
+}
+
+
+@pytest.mark.benchmark(group="dayahead")
+def test_bench_dayahead(benchmark, api_client, mock_get_prices, price_rows, endpoints):
+    """Day-ahead prices: validation, ETag and serialization of 24 slots"""
+    mock_get_prices.return_value = price_rows(BENCH_DATE, **ROWS["PT60M"])
+
+    response = benchmark(
+        api_client.get, endpoints.dayahead, params={"date": BENCH_DATE}
+    )
+    assert response.status_code == 200
+
+
+@pytest.mark.benchmark(group="cheapest")
+@pytest.mark.parametrize("resolution", ROWS)
+def test_bench_cheapest_basic(
+    benchmark, api_client, mock_get_prices, price_rows, endpoints, resolution
+):
+    """Cheapest hours selection"""
+    mock_get_prices.return_value = price_rows(BENCH_DATE, **ROWS[resolution])
+
+    response = benchmark(
+        api_client.get,
+        endpoints.cheapest_basic,
+        params={"date": BENCH_DATE, "hours": 4, "consecutive": "true"},
+    )
+    assert response.status_code == 200
+
+
+@pytest.mark.benchmark(group="cheapest")
+@pytest.mark.parametrize("resolution", ROWS)
+def test_bench_cheapest_advanced(
+    benchmark, api_client, mock_get_prices, price_rows, endpoints, resolution
+):
+    """Block grouping and fallback logic of the advanced endpoint"""
+    mock_get_prices.return_value = price_rows(BENCH_DATE, **ROWS[resolution])
+
+    response = benchmark(
+        api_client.get,
+        endpoints.cheapest_advanced,
+        params={"date": BENCH_DATE, "max_blocks": 4},
+    )
+    assert response.status_code == 200
@@ -3,10 +3,8 @@ Unit tests for ha_entsoe.py core functionality
 """
 
 import pytest
-from datetime import date, datetime, timedelta
-from unittest.mock import patch, Mock
-import pytz
-from xml.etree import ElementTree as ET
+from datetime import date, datetime, timedelta, timezone
+from unittest.mock import patch, Mock, PropertyMock
 
 import ha_entsoe
 from ha_entsoe import (
@@ -26,6 +24,7 @@ from ha_entsoe import (
     merge_with_fallback,
     dt_local,
     fmt_period,
+    fmt_hour_local,
     local_span_day,
     parse_iso_dt,
 )
@@ -101,6 +100,20 @@ class TestXMLParsing:
             parse_xml(xml_text)
         assert "XML parse error" in str(exc_info.value)
 
+    def test_parse_xml_does_not_resolve_external_entities(self, tmp_path):
+        secret = tmp_path / "secret.txt"
+        secret.write_text("top-secret")
+        xml_text = (
+            '<?xml version="1.0"?>'
+            f'<!DOCTYPE root [<!ENTITY x SYSTEM "{secret.as_uri()}">]>'
+            "<root><child>&x;</child></root>"
+        )
+        try:
+            root = parse_xml(xml_text)
+        except EntsoeParseError:
+            return
+        assert "top-secret" not in (root.find("child").text or "")
+
     def test_extract_entsoe_error_with_text(self):
         xml_text = """<?xml version="1.0"?>
         <Acknowledgement_MarketDocument>
@@ -122,6 +135,17 @@ class TestXMLParsing:
         error_msg = extract_entsoe_error(xml_text)
         assert error_msg == "Invalid API key"
 
+    def test_extract_entsoe_error_prefers_reason_text(self):
+        xml_text = """<?xml version="1.0"?>
+        <Acknowledgement_MarketDocument xmlns="urn:iec62325.351:tc57wg16:451-1:acknowledgementdocument:7:0">
+            <Message>Generic failure</Message>
+            <Reason>
+                <text>No matching data found</text>
+            </Reason>
+        </Acknowledgement_MarketDocument>"""
+
+        assert extract_entsoe_error(xml_text) == "No matching data found"
+
     def test_extract_entsoe_error_no_error(self):
         xml_text = '<?xml version="1.0"?><root><data>normal</data></root>'
         error_msg = extract_entsoe_error(xml_text)
@@ -157,11 +181,15 @@ class TestTimeUtilities:
         assert dt.tzinfo is not None
 
     def test_fmt_period(self):
-        amsterdam_tz = pytz.timezone("Europe/Amsterdam")
-        dt = datetime(2023, 10, 28, 14, 30, tzinfo=amsterdam_tz)
+        dt = datetime(2023, 10, 28, 14, 30, tzinfo=ha_entsoe.TZ_LOCAL)
         result = fmt_period(dt)
         assert result == "202310281430"
 
+    def test_fmt_hour_local(self):
+        dt = datetime(2023, 3, 5, 7, 5, tzinfo=ha_entsoe.TZ_LOCAL)
+        assert fmt_hour_local(dt) == dt.strftime("%Y-%m-%d %H:%M")
+        assert fmt_hour_local(dt) == "2023-03-05 07:05"
+
     def test_local_span_day(self):
         test_date = date(2023, 10, 28)
         start, end = local_span_day(test_date)
@@ -188,6 +216,14 @@ class TestTimeUtilities:
         dt_without_tz = parse_iso_dt("2023-10-28T14:30:00")
         assert dt_without_tz.tzinfo is not None
 
+        # ENTSO-E style: minutes precision with a "Z" suffix
+        assert parse_iso_dt("2023-10-28T22:00Z") == datetime(
+            2023, 10, 28, 22, 0, tzinfo=timezone.utc
+        )
+        assert parse_iso_dt("20231028T2200Z") == datetime(
+            2023, 10, 28, 22, 0, tzinfo=timezone.utc
+        )
+
 
 class TestPriceUtilities:
     """Test price conversion and analysis utilities"""
@@ -241,6 +277,17 @@ class TestPriceUtilities:
         expected = {1: 10.0, 2: 0.0, 3: 30.0, 4: 0.0, 5: 50.0}
         assert result == expected
 
+    def test_merge_with_fallback_skips_invalid_positions(self):
+        rows = [
+            {"position": 0, "value": 99.0},
+            {"position": 1, "value": 10.0},
+            {"position": -1, "value": 98.0},
+            {"position": 2, "value": 20.0},
+        ]
+
+        result = merge_with_fallback(rows, "value", default=0.0)
+        assert result == {1: 10.0, 2: 20.0}
+
     def test_merge_with_fallback_empty(self):
         result = merge_with_fallback([], "value", default=0.0)
         assert result == {}
@@ -358,6 +405,57 @@ class TestTimeSeries:
             assert item["timestamp_local"].tzinfo is not None
             assert item["resolution"] == "PT60M"
 
+    def test_ts_points_to_series_multiple_periods(self):
+        """Periods without resolution inherit the first one in the series"""
+        xml_text = """<GL_MarketDocument xmlns="urn:test">
+            <TimeSeries>
+                <Period>
+                    <timeInterval><start>2023-10-27T22:00Z</start></timeInterval>
+                    <resolution>PT15M</resolution>
+                    <Point><position>2</position><quantity>10</quantity></Point>
+                </Period>
+                <Period>
+                    <timeInterval><start>2023-10-28T10:00Z</start></timeInterval>
+                    <Point><position>1</position><quantity>20</quantity></Point>
+                </Period>
+            </TimeSeries>
+        </GL_MarketDocument>"""
+        ts = ha_entsoe.pick_timeseries(parse_xml(xml_text))[0]
+
+        items = ha_entsoe.ts_points_to_series(date(2023, 10, 28), ts)
+
+        assert [it["quantity"] for it in items] == [10.0, 20.0]
+        assert [it["resolution"] for it in items] == ["PT15M", "PT15M"]
+        assert items[0]["timestamp_local"].strftime("%H:%M") == "00:15"
+        assert items[1]["timestamp_local"].strftime("%H:%M") == "12:00"
+
+    def test_ts_points_to_series_dst_end(self):
+        """The 25-hour day keeps both 02:00 slots with their own UTC offset"""
+        points = "".join(
+            f"<Point><position>{i}</position><price.amount>{i}</price.amount></Point>"
+            for i in range(1, 26)
+        )
+        xml_text = f"""<Publication_MarketDocument>
+            <TimeSeries><Period>
+                <timeInterval><start>2023-10-28T22:00Z</start></timeInterval>
+                <resolution>PT60M</resolution>{points}
+            </Period></TimeSeries>
+        </Publication_MarketDocument>"""
+        ts = ha_entsoe.pick_timeseries(parse_xml(xml_text))[0]
+
+        items = ha_entsoe.ts_points_to_series(date(2023, 10, 29), ts)
+
+        hours = [fmt_hour_local(it["timestamp_local"]) for it in items]
+        assert hours[:4] == [
+            "2023-10-29 00:00",
+            "2023-10-29 01:00",
+            "2023-10-29 02:00",
+            "2023-10-29 02:00",
+        ]
+        assert hours[-1] == "2023-10-29 23:00"
+        offsets = [it["timestamp_local"].utcoffset() for it in items[2:4]]
+        assert offsets == [timedelta(hours=2), timedelta(hours=1)]
+
     def test_coalesce_by_timestamp_last(self):
         """Test timestamp deduplication with 'last' preference"""
         items = [
@@ -487,6 +585,243 @@ class TestHTTPRequests:
 
         assert exc_info.value.status == 502  # Mapped to 502
 
+    def test_request_entsoe_backoff_schedule(self, mock_requests_get):
+        """Retries sleep according to the precomputed backoff schedule"""
+        mock_response = Mock()
+        mock_response.status_code = 503
+        mock_response.text = "Service Unavailable"
+        mock_requests_get.return_value = mock_response
+
+        with patch("ha_entsoe.require_api_key", return_value="test-key"), patch(
+            "ha_entsoe.time.sleep"
+        ) as mock_sleep, patch("ha_entsoe.random.random", return_value=0.0):
+            with pytest.raises(EntsoeServerError):
+                ha_entsoe.request_entsoe({"documentType": "A44"})
+
+        delays = [c.args[0] for c in mock_sleep.call_args_list]
+        assert delays == list(ha_entsoe._BACKOFF_SCHEDULE[1 : ha_entsoe.MAX_RETRIES])
+        assert all(d <= ha_entsoe.BACKOFF_CAP_SECONDS for d in delays)
+
+    @pytest.mark.parametrize(
+        "header, expected",
+        [("7", 7.0), ("600", ha_entsoe.BACKOFF_CAP_SECONDS), ("soon", None)],
+    )
+    def test_request_entsoe_honours_retry_after(
+        self, mock_requests_get, header, expected
+    ):
+        """429 responses wait for Retry-After, capped by BACKOFF_CAP_SECONDS"""
+        mock_response = Mock()
+        mock_response.status_code = 429
+        mock_response.text = "Too Many Requests"
+        mock_response.headers = {"Retry-After": header}
+        mock_requests_get.return_value = mock_response
+
+        with patch("ha_entsoe.require_api_key", return_value="test-key"), patch(
+            "ha_entsoe.time.sleep"
+        ) as mock_sleep, patch("ha_entsoe.random.random", return_value=0.0):
+            with pytest.raises(EntsoeRateLimited) as exc_info:
+                ha_entsoe.request_entsoe({"documentType": "A44"})
+
+        first_delay = mock_sleep.call_args_list[0].args[0]
+        if expected is None:
+            assert "retry_after_s" not in exc_info.value.details
+            assert first_delay == ha_entsoe._BACKOFF_SCHEDULE[1]
+        else:
+            assert first_delay == expected
+
+    @pytest.mark.parametrize("content_type", ["application/xml", "text/xml"])
+    def test_request_entsoe_decodes_utf8_without_detection(
+        self, mock_requests_get, mock_entsoe_response, content_type
+    ):
+        """XML bodies without a charset are decoded as UTF-8 directly"""
+        from requests.models import Response
+        from requests.utils import get_encoding_from_headers
+
+        body = mock_entsoe_response.replace("test-document-id", "prijs-€-ü")
+        resp = Response()
+        resp.status_code = 200
+        resp.headers["Content-Type"] = content_type
+        # requests assumes ISO-8859-1 for text/* without a charset
+        resp.encoding = get_encoding_from_headers(resp.headers)
+        resp._content = body.encode("utf-8")
+        mock_requests_get.return_value = resp
+
+        with patch("ha_entsoe.require_api_key", return_value="test-key"), patch(
+            "requests.models.Response.apparent_encoding",
+            new_callable=PropertyMock,
+            side_effect=AssertionError("charset detection used"),
+        ):
+            text = ha_entsoe.request_entsoe({"documentType": "A44"})
+
+        assert text == body
+
+    def test_request_entsoe_memory_cache(
+        self, mock_requests_get, mock_entsoe_response, tmp_path
+    ):
+        """Cached responses are served from memory without touching disk"""
+        mock_response = Mock()
+        mock_response.status_code = 200
+        mock_response.text = mock_entsoe_response
+        mock_requests_get.return_value = mock_response
+
+        params = {"documentType": "A44", "in_Domain": "10YNL----------L"}
+
+        with patch("ha_entsoe.require_api_key", return_value="test-key"), patch(
+            "ha_entsoe.CACHE_DIR", tmp_path
+        ), patch("ha_entsoe.SAVE_RAW", False):
+            first = ha_entsoe.request_entsoe(params, "mem_key", 60)
+            with patch("pathlib.Path.exists", side_effect=AssertionError):
+                second = ha_entsoe.request_entsoe(params, "mem_key", 60)
+
+            ha_entsoe.flush_pending_writes()
+            ha_entsoe.clear_memory_cache()
+            third = ha_entsoe.request_entsoe(params, "mem_key", 60)
+
+        assert first == second == third == mock_entsoe_response
+        mock_requests_get.assert_called_once()
+
+    def test_request_entsoe_conditional_get(
+        self, mock_requests_get, mock_entsoe_response, tmp_path
+    ):
+        """An expired cache entry is revalidated and reused on 304"""
+        import os
+
+        fresh = Mock()
+        fresh.status_code = 200
+        fresh.text = mock_entsoe_response
+        fresh.headers = {
+            "ETag": '"v1"',
+            "Last-Modified": "Fri, 27 Oct 2023 12:00:00 GMT",
+        }
+        not_modified = Mock()
+        not_modified.status_code = 304
+        not_modified.text = ""
+        mock_requests_get.side_effect = [fresh, not_modified]
+
+        params = {"documentType": "A44", "in_Domain": "10YNL----------L"}
+
+        with patch("ha_entsoe.require_api_key", return_value="test-key"), patch(
+            "ha_entsoe.CACHE_DIR", tmp_path
+        ), patch("ha_entsoe.SAVE_RAW", False):
+            first = ha_entsoe.request_entsoe(params, "cond_key", 60)
+            ha_entsoe.flush_pending_writes()
+            cache_file = ha_entsoe._cache_path(ha_entsoe._cache_digest(params))
+            os.utime(cache_file, (1, 1))
+            with ha_entsoe._CACHE_MEM_LOCK:
+                ha_entsoe._CACHE_MEM.clear()
+
+            second = ha_entsoe.request_entsoe(params, "cond_key", 60)
+
+        assert first == second == mock_entsoe_response
+        assert mock_requests_get.call_args_list[0].kwargs["headers"] is None
+        assert mock_requests_get.call_args_list[1].kwargs["headers"] == {
+            "If-None-Match": '"v1"',
+            "If-Modified-Since": "Fri, 27 Oct 2023 12:00:00 GMT",
+        }
+        assert cache_file.stat().st_mtime > 1
+
+    def test_request_entsoe_writes_files_in_background(
+        self, mock_requests_get, mock_entsoe_response, tmp_path
+    ):
+        """Cache and raw files are written atomically off the request path"""
+        mock_response = Mock()
+        mock_response.status_code = 200
+        mock_response.text = mock_entsoe_response
+        mock_requests_get.return_value = mock_response
+
+        params = {
+            "documentType": "A44",
+            "in_Domain": "10YNL----------L",
+            "out_Domain": "10YNL----------L",
+            "periodStart": "202310280000",
+        }
+
+        with patch("ha_entsoe.require_api_key", return_value="test-key"), patch(
+            "ha_entsoe.CACHE_DIR", tmp_path / "cache"
+        ), patch("ha_entsoe.DATA_ROOT", tmp_path / "data"), patch(
+            "ha_entsoe.SAVE_RAW", True
+        ):
+            (tmp_path / "cache").mkdir()
+            ha_entsoe.request_entsoe(params, "bg_key", 60)
+            ha_entsoe.flush_pending_writes()
+
+        digest = ha_entsoe._cache_digest(params)
+        cache_file = tmp_path / "cache" / digest[:2] / f"{digest}.xml"
+        assert cache_file.read_text(encoding="utf-8") == mock_entsoe_response
+        raw_files = list((tmp_path / "data").rglob("*.xml"))
+        assert len(raw_files) == 1
+        assert not list(tmp_path.rglob("*.tmp"))
+
+    def test_background_writes_keep_latest_text(self, tmp_path):
+        """A write queued while the same file is being written is not lost"""
+        import threading
+
+        target = tmp_path / "doc.xml"
+        started, release = threading.Event(), threading.Event()
+        written = []
+        atomic_write = ha_entsoe._atomic_write
+
+        def slow_write(path, text):
+            written.append(text)
+            started.set()
+            release.wait(5)
+            atomic_write(path, text)
+
+        with patch("ha_entsoe._atomic_write", side_effect=slow_write):
+            ha_entsoe._write_in_background(target, "v1")
+            assert started.wait(5)
+            ha_entsoe._write_in_background(target, "v2")
+            ha_entsoe._write_in_background(target, "v3")
+            release.set()
+            ha_entsoe.flush_pending_writes()
+
+        assert written == ["v1", "v3"]
+        assert target.read_text(encoding="utf-8") == "v3"
+
+    def test_http_session_is_shared(self):
+        """All requests go through one pooled session"""
+        session = ha_entsoe._http_session()
+
+        assert ha_entsoe._http_session() is session
+        adapter = session.get_adapter(ha_entsoe.API_ENDPOINT)
+        assert adapter.max_retries.total == 0
+
+    def test_cache_digest_ignores_token_and_key_order(self):
+        """Identical requests share one fixed-length cache key"""
+        a = {"documentType": "A65", "processType": "A01", "securityToken": "x"}
+        b = {"processType": "A01", "documentType": "A65", "securityToken": "y"}
+
+        assert ha_entsoe._cache_digest(a) == ha_entsoe._cache_digest(b)
+        assert len(ha_entsoe._cache_digest(a)) == 32
+        assert ha_entsoe._cache_digest(a) != ha_entsoe._cache_digest(
+            {"documentType": "A44"}
+        )
+
+    @pytest.mark.parametrize(
+        "status,error_cls,reason",
+        [
+            (403, EntsoeForbidden, "403 Forbidden"),
+            (404, EntsoeNotFound, "404 Not Found"),
+            (400, EntsoeError, "HTTP 400"),
+        ],
+    )
+    def test_request_entsoe_client_errors(
+        self, mock_requests_get, status, error_cls, reason
+    ):
+        """Test 4xx responses map to their error class without retrying"""
+        mock_response = Mock()
+        mock_response.status_code = status
+        mock_response.text = "error"
+        mock_requests_get.return_value = mock_response
+
+        with patch("ha_entsoe.require_api_key", return_value="test-key"):
+            with pytest.raises(error_cls) as exc_info:
+                ha_entsoe.request_entsoe({"documentType": "A44"})
+
+        assert reason in str(exc_info.value)
+        assert exc_info.value.status == status
+        mock_requests_get.assert_called_once()
+
 
 @pytest.mark.slow
 class TestDataFunctions:
@@ -513,6 +848,29 @@ class TestDataFunctions:
         assert all("ct_per_kwh" in price for price in prices)
         assert all("hour_local" in price for price in prices)
 
+    def test_get_day_ahead_prices_reuses_parsed_rows(
+        self, mock_requests_get, mock_entsoe_response
+    ):
+        """The same XML is parsed once; callers get independent copies"""
+        mock_response = Mock()
+        mock_response.status_code = 200
+        mock_response.text = mock_entsoe_response
+        mock_requests_get.return_value = mock_response
+
+        test_date = date(2023, 10, 28)
+
+        with patch("ha_entsoe.require_api_key", return_value="test-key"), patch(
+            "pathlib.Path.exists", return_value=False
+        ), patch("ha_entsoe.parse_xml", wraps=ha_entsoe.parse_xml) as spy:
+            first = ha_entsoe.get_day_ahead_prices(test_date)
+            first[0]["eur_per_mwh"] = -1.0
+            second = ha_entsoe.get_day_ahead_prices(test_date)
+
+        # Second call is a memory-cache hit and reuses the parsed rows
+        assert mock_requests_get.call_count == 1
+        assert spy.call_count == 1
+        assert second[0]["eur_per_mwh"] == 45.67
+
     def test_get_day_ahead_prices_no_data(self, mock_requests_get):
         """Test price retrieval with no data response"""
         error_xml = """<?xml version="1.0"?>
@@ -537,71 +895,93 @@ class TestDataFunctions:
 
         assert "No matching data found" in str(exc_info.value)
 
-
-class TestGenerationForecast:
-    """Test generation forecast functionality"""
-
-    def test_get_generation_forecast_single_psr(self, mock_requests_get):
-        """Test generation forecast with single PSR type"""
-        generation_xml = """<?xml version="1.0"?>
-        <GL_MarketDocument>
-            <TimeSeries>
-                <productionType>B16</productionType>
-                <psrType>B16</psrType>
-                <Period>
-                    <timeInterval>
-                        <start>2023-10-27T23:00Z</start>
-                        <end>2023-10-28T23:00Z</end>
-                    </timeInterval>
-                    <resolution>PT60M</resolution>
-                    <Point>
-                        <position>1</position>
-                        <quantity>1500.0</quantity>
-                    </Point>
-                    <Point>
-                        <position>2</position>
-                        <quantity>1600.0</quantity>
-                    </Point>
-                </Period>
-            </TimeSeries>
-        </GL_MarketDocument>"""
-
+    @pytest.mark.parametrize(
+        "xml_fixture, fetch, key, expected",
+        [
+            pytest.param(
+                "sample_generation_xml",
+                lambda d: ha_entsoe.get_generation_forecast(d, psr_types=["B16"]),
+                "forecast_mw",
+                {"production_type": "B16", "psr_type": "B16"},
+                id="generation-single-psr",
+            ),
+            pytest.param(
+                "sample_netpos_xml",
+                ha_entsoe.get_net_position,
+                "net_position_mw",
+                {},
+                id="net-position",
+            ),
+            pytest.param(
+                "sample_exchange_xml",
+                lambda d: ha_entsoe.get_scheduled_exchanges(
+                    d, "10YNL----------L", "10YBE----------2"
+                ),
+                "scheduled_mw",
+                {},
+                id="scheduled-exchanges",
+            ),
+            pytest.param(
+                "sample_load_xml",
+                ha_entsoe.get_day_ahead_total_load_forecast,
+                "forecast_mw",
+                {},
+                id="load-forecast",
+            ),
+        ],
+    )
+    def test_quantity_getters(
+        self, request, mock_requests_get, xml_fixture, fetch, key, expected
+    ):
+        """Quantity documents turn into hourly rows with the getter's value key"""
         mock_response = Mock()
         mock_response.status_code = 200
-        mock_response.text = generation_xml
+        mock_response.text = request.getfixturevalue(xml_fixture)
         mock_requests_get.return_value = mock_response
 
-        test_date = date(2023, 10, 28)
-
         with patch("ha_entsoe.require_api_key", return_value="test-key"):
             with patch("pathlib.Path.exists", return_value=False):
-                result = ha_entsoe.get_generation_forecast(test_date, psr_types=["B16"])
+                result = fetch(date(2023, 10, 28))
 
         assert len(result) >= 1
-        assert result[0]["production_type"] == "B16"
-        assert result[0]["psr_type"] == "B16"
-        assert "forecast_mw" in result[0]
+        assert key in result[0]
+        assert "hour_local" in result[0]
+        for field, value in expected.items():
+            assert result[0][field] == value
+
+
+class TestGenerationForecast:
+    """Test generation forecast functionality"""
 
     def test_get_generation_forecast_multiple_psr(self, mock_requests_get):
-        """Test generation forecast with multiple PSR types"""
-        generation_xml = """<?xml version="1.0"?>
-        <GL_MarketDocument>
+        """Multiple PSR types come from one unfiltered request"""
+
+        def series(psr, quantities):
+            points = "".join(
+                f"<Point><position>{i}</position><quantity>{q}</quantity></Point>"
+                for i, q in enumerate(quantities, start=1)
+            )
+            return f"""
             <TimeSeries>
-                <productionType>B16</productionType>
-                <psrType>B16</psrType>
+                <productionType>{psr}</productionType>
+                <psrType>{psr}</psrType>
                 <Period>
                     <timeInterval>
-                        <start>2023-10-27T23:00Z</start>
-                        <end>2023-10-28T23:00Z</end>
+                        <start>2023-10-27T22:00Z</start>
+                        <end>2023-10-28T22:00Z</end>
                     </timeInterval>
                     <resolution>PT60M</resolution>
-                    <Point>
-                        <position>1</position>
-                        <quantity>1500.0</quantity>
-                    </Point>
+                    {points}
                 </Period>
-            </TimeSeries>
-        </GL_MarketDocument>"""
+            </TimeSeries>"""
+
+        generation_xml = (
+            '<?xml version="1.0"?><GL_MarketDocument>'
+            + series("B16", [100.0, 200.0])
+            + series("B18", [1500.0, 1600.0])
+            + series("B19", [900.0, 800.0])
+            + "</GL_MarketDocument>"
+        )
 
         mock_response = Mock()
         mock_response.status_code = 200
@@ -613,11 +993,19 @@ class TestGenerationForecast:
         with patch("ha_entsoe.require_api_key", return_value="test-key"):
             with patch("pathlib.Path.exists", return_value=False):
                 result = ha_entsoe.get_generation_forecast(
-                    test_date, psr_types=["B16", "B18"]
+                    test_date, psr_types=["B18", "B16"]
                 )
 
-        # Should call the API twice (once for each PSR type)
-        assert mock_requests_get.call_count == 2
+        # One request without psrType, filtered and numbered per PSR type
+        assert mock_requests_get.call_count == 1
+        sent = mock_requests_get.call_args.kwargs["params"]
+        assert "psrType" not in sent
+        assert [(r["psr_type"], r["position"], r["forecast_mw"]) for r in result] == [
+            ("B16", 1, 100.0),
+            ("B16", 2, 200.0),
+            ("B18", 1, 1500.0),
+            ("B18", 2, 1600.0),
+        ]
 
     def test_parse_generation_rows(self):
         """Test generation row parsing with deduplication"""
@@ -670,153 +1058,14 @@ class TestGenerationForecast:
         assert all("forecast_mw" in row for row in result)
 
 
-class TestNetworkFunctions:
-    """Test network position and exchange functions"""
-
-    def test_get_net_position(self, mock_requests_get):
-        """Test net position retrieval"""
-        netpos_xml = """<?xml version="1.0"?>
-        <GL_MarketDocument>
-            <TimeSeries>
-                <Period>
-                    <timeInterval>
-                        <start>2023-10-27T23:00Z</start>
-                        <end>2023-10-28T23:00Z</end>
-                    </timeInterval>
-                    <resolution>PT60M</resolution>
-                    <Point>
-                        <position>1</position>
-                        <quantity>-500.0</quantity>
-                    </Point>
-                    <Point>
-                        <position>2</position>
-                        <quantity>-600.0</quantity>
-                    </Point>
-                </Period>
-            </TimeSeries>
-        </GL_MarketDocument>"""
-
-        mock_response = Mock()
-        mock_response.status_code = 200
-        mock_response.text = netpos_xml
-        mock_requests_get.return_value = mock_response
-
-        test_date = date(2023, 10, 28)
-
-        with patch("ha_entsoe.require_api_key", return_value="test-key"):
-            with patch("pathlib.Path.exists", return_value=False):
-                result = ha_entsoe.get_net_position(test_date)
-
-        assert len(result) >= 1
-        assert "net_position_mw" in result[0]
-        assert "hour_local" in result[0]
-
-    def test_get_scheduled_exchanges(self, mock_requests_get):
-        """Test scheduled exchanges retrieval"""
-        exchange_xml = """<?xml version="1.0"?>
-        <GL_MarketDocument>
-            <TimeSeries>
-                <Period>
-                    <timeInterval>
-                        <start>2023-10-27T23:00Z</start>
-                        <end>2023-10-28T23:00Z</end>
-                    </timeInterval>
-                    <resolution>PT60M</resolution>
-                    <Point>
-                        <position>1</position>
-                        <quantity>250.0</quantity>
-                    </Point>
-                    <Point>
-                        <position>2</position>
-                        <quantity>300.0</quantity>
-                    </Point>
-                </Period>
-            </TimeSeries>
-        </GL_MarketDocument>"""
-
-        mock_response = Mock()
-        mock_response.status_code = 200
-        mock_response.text = exchange_xml
-        mock_requests_get.return_value = mock_response
-
-        test_date = date(2023, 10, 28)
-        from_zone = "10YNL----------L"
-        to_zone = "10YBE----------2"
-
-        with patch("ha_entsoe.require_api_key", return_value="test-key"):
-            with patch("pathlib.Path.exists", return_value=False):
-                result = ha_entsoe.get_scheduled_exchanges(
-                    test_date, from_zone, to_zone
-                )
-
-        assert len(result) >= 1
-        assert "scheduled_mw" in result[0]
-        assert "hour_local" in result[0]
-
-
 class TestLoadFunctions:
     """Test load forecast and actual load functions"""
 
-    def test_get_day_ahead_total_load_forecast(self, mock_requests_get):
-        """Test day-ahead load forecast"""
-        load_xml = """<?xml version="1.0"?>
-        <GL_MarketDocument>
-            <TimeSeries>
-                <Period>
-                    <timeInterval>
-                        <start>2023-10-27T23:00Z</start>
-                        <end>2023-10-28T23:00Z</end>
-                    </timeInterval>
-                    <resolution>PT60M</resolution>
-                    <Point>
-                        <position>1</position>
-                        <quantity>12000.0</quantity>
-                    </Point>
-                    <Point>
-                        <position>2</position>
-                        <quantity>11500.0</quantity>
-                    </Point>
-                </Period>
-            </TimeSeries>
-        </GL_MarketDocument>"""
-
-        mock_response = Mock()
-        mock_response.status_code = 200
-        mock_response.text = load_xml
-        mock_requests_get.return_value = mock_response
-
-        test_date = date(2023, 10, 28)
-
-        with patch("ha_entsoe.require_api_key", return_value="test-key"):
-            with patch("pathlib.Path.exists", return_value=False):
-                result = ha_entsoe.get_day_ahead_total_load_forecast(test_date)
-
-        assert len(result) >= 1
-        assert "forecast_mw" in result[0]
-        assert "hour_local" in result[0]
-
-    def test_get_total_load(self, mock_requests_get):
+    def test_get_total_load(self, mock_requests_get, sample_load_xml):
         """Test combined day-ahead and actual load"""
-        load_xml = """<?xml version="1.0"?>
-        <GL_MarketDocument>
-            <TimeSeries>
-                <Period>
-                    <timeInterval>
-                        <start>2023-10-27T23:00Z</start>
-                        <end>2023-10-28T23:00Z</end>
-                    </timeInterval>
-                    <resolution>PT60M</resolution>
-                    <Point>
-                        <position>1</position>
-                        <quantity>12000.0</quantity>
-                    </Point>
-                </Period>
-            </TimeSeries>
-        </GL_MarketDocument>"""
-
         mock_response = Mock()
         mock_response.status_code = 200
-        mock_response.text = load_xml
+        mock_response.text = sample_load_xml
         mock_requests_get.return_value = mock_response
 
         test_date = date(2023, 10, 28)
@@ -860,101 +1109,8 @@ class TestLoadFunctions:
 class TestPlanningFunctions:
     """Test automation planning and suggestion functions"""
 
-    def test_suggest_automation_basic(self, mock_requests_get):
+    def test_suggest_automation_basic(self, mock_entsoe_by_doc_type):
         """Test basic automation suggestion"""
-        # Mock prices response
-        price_xml = """<?xml version="1.0"?>
-        <Publication_MarketDocument>
-            <TimeSeries>
-                <Period>
-                    <timeInterval>
-                        <start>2023-10-27T23:00Z</start>
-                        <end>2023-10-28T23:00Z</end>
-                    </timeInterval>
-                    <resolution>PT60M</resolution>
-                    <Point>
-                        <position>1</position>
-                        <price.amount>45.67</price.amount>
-                    </Point>
-                    <Point>
-                        <position>2</position>
-                        <price.amount>30.50</price.amount>
-                    </Point>
-                    <Point>
-                        <position>3</position>
-                        <price.amount>55.20</price.amount>
-                    </Point>
-                </Period>
-            </TimeSeries>
-        </Publication_MarketDocument>"""
-
-        # Mock generation response
-        gen_xml = """<?xml version="1.0"?>
-        <GL_MarketDocument>
-            <TimeSeries>
-                <productionType>B16</productionType>
-                <psrType>B16</psrType>
-                <Period>
-                    <timeInterval>
-                        <start>2023-10-27T23:00Z</start>
-                        <end>2023-10-28T23:00Z</end>
-                    </timeInterval>
-                    <resolution>PT60M</resolution>
-                    <Point>
-                        <position>1</position>
-                        <quantity>1500.0</quantity>
-                    </Point>
-                    <Point>
-                        <position>2</position>
-                        <quantity>1600.0</quantity>
-                    </Point>
-                </Period>
-            </TimeSeries>
-        </GL_MarketDocument>"""
-
-        # Mock load response
-        load_xml = """<?xml version="1.0"?>
-        <GL_MarketDocument>
-            <TimeSeries>
-                <Period>
-                    <timeInterval>
-                        <start>2023-10-27T23:00Z</start>
-                        <end>2023-10-28T23:00Z</end>
-                    </timeInterval>
-                    <resolution>PT60M</resolution>
-                    <Point>
-                        <position>1</position>
-                        <quantity>12000.0</quantity>
-                    </Point>
-                    <Point>
-                        <position>2</position>
-                        <quantity>11000.0</quantity>
-                    </Point>
-                </Period>
-            </TimeSeries>
-        </GL_MarketDocument>"""
-
-        # Setup mock to return different responses based on documentType
-        def mock_response_side_effect(*args, **kwargs):
-            mock_response = Mock()
-            mock_response.status_code = 200
-
-            params = kwargs.get("params", {})
-            doc_type = params.get("documentType", "")
-
-            if doc_type == "A44":  # Prices
-                mock_response.text = price_xml
-            elif doc_type == "A69":  # Generation
-                mock_response.text = gen_xml
-            elif doc_type == "A65":  # Load forecast
-                mock_response.text = load_xml
-            else:
-                mock_response.text = load_xml  # Default
-
-            return mock_response
-
-        mock_requests_get.side_effect = mock_response_side_effect
-
         test_date = date(2023, 10, 28)
 
         with patch("ha_entsoe.require_api_key", return_value="test-key"):
@@ -968,81 +1124,8 @@ class TestPlanningFunctions:
         assert "thresholds" in result
         assert len(result["cheapest_hours_positions"]) > 0
 
-    def test_suggest_automation_future_date_skip_a68(self, mock_requests_get):
+    def test_suggest_automation_future_date_skip_a68(self, mock_entsoe_by_doc_type):
         """Test automation suggestion for future date with A68 skipping"""
-        price_xml = """<?xml version="1.0"?>
-        <Publication_MarketDocument>
-            <TimeSeries>
-                <Period>
-                    <timeInterval>
-                        <start>2023-10-27T23:00Z</start>
-                        <end>2023-10-28T23:00Z</end>
-                    </timeInterval>
-                    <resolution>PT60M</resolution>
-                    <Point>
-                        <position>1</position>
-                        <price.amount>45.67</price.amount>
-                    </Point>
-                </Period>
-            </TimeSeries>
-        </Publication_MarketDocument>"""
-
-        gen_xml = """<?xml version="1.0"?>
-        <GL_MarketDocument>
-            <TimeSeries>
-                <productionType>B16</productionType>
-                <psrType>B16</psrType>
-                <Period>
-                    <timeInterval>
-                        <start>2023-10-27T23:00Z</start>
-                        <end>2023-10-28T23:00Z</end>
-                    </timeInterval>
-                    <resolution>PT60M</resolution>
-                    <Point>
-                        <position>1</position>
-                        <quantity>1500.0</quantity>
-                    </Point>
-                </Period>
-            </TimeSeries>
-        </GL_MarketDocument>"""
-
-        load_xml = """<?xml version="1.0"?>
-        <GL_MarketDocument>
-            <TimeSeries>
-                <Period>
-                    <timeInterval>
-                        <start>2023-10-27T23:00Z</start>
-                        <end>2023-10-28T23:00Z</end>
-                    </timeInterval>
-                    <resolution>PT60M</resolution>
-                    <Point>
-                        <position>1</position>
-                        <quantity>12000.0</quantity>
-                    </Point>
-                </Period>
-            </TimeSeries>
-        </GL_MarketDocument>"""
-
-        def mock_response_side_effect(*args, **kwargs):
-            mock_response = Mock()
-            mock_response.status_code = 200
-
-            params = kwargs.get("params", {})
-            doc_type = params.get("documentType", "")
-
-            if doc_type == "A44":
-                mock_response.text = price_xml
-            elif doc_type == "A69":
-                mock_response.text = gen_xml
-            elif doc_type == "A65":
-                mock_response.text = load_xml
-            else:
-                mock_response.text = load_xml
-
-            return mock_response
-
-        mock_requests_get.side_effect = mock_response_side_effect
-
         # Test with future date (should skip A68 and use A65 only)
         future_date = date.today() + timedelta(days=2)
 
@@ -1137,13 +1220,13 @@ class TestRowsFromItems:
         """Test price row generation"""
         items = [
             {
-                "timestamp_local": datetime(2023, 10, 28, 1, 0, tzinfo=pytz.UTC),
+                "timestamp_local": datetime(2023, 10, 28, 1, 0, tzinfo=timezone.utc),
                 "price": 45.67,
                 "quantity": None,
                 "resolution": "PT60M",
             },
             {
-                "timestamp_local": datetime(2023, 10, 28, 2, 0, tzinfo=pytz.UTC),
+                "timestamp_local": datetime(2023, 10, 28, 2, 0, tzinfo=timezone.utc),
                 "price": 42.34,
                 "quantity": None,
                 "resolution": "PT60M",
@@ -1162,13 +1245,13 @@ class TestRowsFromItems:
         """Test quantity row generation"""
         items = [
             {
-                "timestamp_local": datetime(2023, 10, 28, 1, 0, tzinfo=pytz.UTC),
+                "timestamp_local": datetime(2023, 10, 28, 1, 0, tzinfo=timezone.utc),
                 "price": None,
                 "quantity": 1500.0,
                 "resolution": "PT60M",
             },
             {
-                "timestamp_local": datetime(2023, 10, 28, 2, 0, tzinfo=pytz.UTC),
+                "timestamp_local": datetime(2023, 10, 28, 2, 0, tzinfo=timezone.utc),
                 "price": None,
                 "quantity": 1600.0,
                 "resolution": "PT60M",
@@ -1186,13 +1269,13 @@ class TestRowsFromItems:
         """Test that None values are skipped"""
         items = [
             {
-                "timestamp_local": datetime(2023, 10, 28, 1, 0, tzinfo=pytz.UTC),
+                "timestamp_local": datetime(2023, 10, 28, 1, 0, tzinfo=timezone.utc),
                 "price": 45.67,
                 "quantity": None,
                 "resolution": "PT60M",
             },
             {
-                "timestamp_local": datetime(2023, 10, 28, 2, 0, tzinfo=pytz.UTC),
+                "timestamp_local": datetime(2023, 10, 28, 2, 0, tzinfo=timezone.utc),
                 "price": None,  # This should be skipped
                 "quantity": None,
                 "resolution": "PT60M",
@@ -1271,3 +1354,151 @@ class TestPickTimeseries:
             ha_entsoe.pick_timeseries(root)
 
         assert "No TimeSeries found" in str(exc_info.value)
+
+
+class TestCLI:
+    """Test CLI command handlers"""
+
+    def test_cmd_prices_outputs_json(self, capsys):
+        """cmd_prices writes the rows as JSON to stdout"""
+        import json
+
+        rows = [{"position": 1, "hour_local": "2023-10-28 00:00", "ct_per_kwh": 4.5}]
+        with patch("ha_entsoe.get_day_ahead_prices", return_value=rows):
+            ha_entsoe.main(["prices", "2023-10-28", "10YNL----------L"])
+
+        out = json.loads(capsys.readouterr().out)
+        assert out == {"date": "2023-10-28", "zone": "10YNL----------L", "prices": rows}
+
+    def test_cmd_prices_without_orjson(self, capsys):
+        """The stdlib encoder is used when orjson is not installed"""
+        import json
+
+        rows = [{"position": 1, "hour_local": "2023-10-28 00:00", "ct_per_kwh": 4.5}]
+        with patch("ha_entsoe.get_day_ahead_prices", return_value=rows), patch(
+            "ha_entsoe.orjson", None
+        ):
+            ha_entsoe.main(["prices", "2023-10-28"])
+
+        out = json.loads(capsys.readouterr().out)
+        assert out["prices"] == rows
+
+    def test_emit_compact_when_piped(self, capsys):
+        """Output is compact unless stdout is a terminal or --pretty is given"""
+        ha_entsoe._emit({"a": [1, 2]})
+        assert capsys.readouterr().out == '{"a":[1,2]}\n'
+
+        with patch("ha_entsoe.PRETTY_OUTPUT", True):
+            ha_entsoe._emit({"a": [1, 2]})
+        assert capsys.readouterr().out.startswith('{\n  "a": [')
+
+    def test_main_pretty_flag(self, capsys):
+        """--pretty forces indented output"""
+        rows = [{"position": 1}]
+        with patch("ha_entsoe.get_day_ahead_prices", return_value=rows), patch(
+            "ha_entsoe.PRETTY_OUTPUT", None
+        ):
+            ha_entsoe.main(["prices", "2023-10-28", "--pretty"])
+            assert ha_entsoe.PRETTY_OUTPUT is True
+
+        assert '\n  "date": "2023-10-28"' in capsys.readouterr().out
+
+    def test_gather_keeps_task_order(self):
+        """_gather returns results in task order"""
+        assert ha_entsoe._gather([]) == []
+        results = ha_entsoe._gather([(lambda x: x * 2, (i,)) for i in range(6)])
+        assert results == [0, 2, 4, 6, 8, 10]
+
+    def test_cmd_all_combines_datasets(self, capsys):
+        """cmd_all fetches all datasets and emits one document"""
+        import json
+
+        with patch(
+            "ha_entsoe.get_day_ahead_prices", return_value=[{"position": 1}]
+        ), patch("ha_entsoe.get_day_ahead_total_load_forecast", return_value=[]), patch(
+            "ha_entsoe.get_generation_forecast", return_value=[]
+        ), patch(
+            "ha_entsoe.get_net_position", return_value=[]
+        ):
+            ha_entsoe.main(["all", "2023-10-28"])
+
+        out = json.loads(capsys.readouterr().out)
+        assert out["prices"] == [{"position": 1}]
+        assert set(out) == {
+            "date",
+            "zone",
+            "prices",
+            "load_forecast",
+            "generation_forecast",
+            "net_position",
+        }
+
+    def test_main_parses_subcommand_arguments(self):
+        """Positional arguments end up on the namespace"""
+        ns = ha_entsoe._PARSER.parse_args(
+            ["gen-forecast", "2023-10-28", "10YNL----------L", "B16", "B18"]
+        )
+        assert ns.func is ha_entsoe.cmd_gen_forecast
+        assert ns.date == date(2023, 10, 28)
+        assert ns.psr_types == ["B16", "B18"]
+
+        ns = ha_entsoe._PARSER.parse_args(["prices"])
+        assert ns.date is None
+        assert ns.zone == ha_entsoe.ZONE_EIC_DEFAULT
+
+    def test_main_usage_error_is_json(self, capsys):
+        """Usage errors are reported as BAD_REQUEST on stderr"""
+        import json
+
+        with pytest.raises(SystemExit) as exc_info:
+            ha_entsoe.main(["exchanges", "2023-10-28", "10YNL----------L"])
+
+        assert exc_info.value.code == 1
+        err = json.loads(capsys.readouterr().err)
+        assert err["error"]["code"] == "BAD_REQUEST"
+
+    def test_invalid_date_is_bad_request(self, capsys):
+        """All commands share one date validator"""
+        import json
+
+        for argv in (["prices", "28-10-2023"], ["exchanges", "x", "A", "B"]):
+            with pytest.raises(SystemExit):
+                ha_entsoe.main(argv)
+            err = json.loads(capsys.readouterr().err)["error"]
+            assert err["code"] == "BAD_REQUEST"
+            assert "expected YYYY-MM-DD" in err["message"]
+
+    def test_write_stdout_to_file_descriptor(self, capfd):
+        """The pre-encoded buffer is written straight to the stdout fd"""
+        ha_entsoe._write_stdout('{"a":"é"}\n'.encode("utf-8"))
+        assert capfd.readouterr().out == '{"a":"é"}\n'
+
+    def test_command_errors_are_json(self, capsys):
+        """EntsoeError from a getter becomes a JSON error and exit code 1"""
+        import json
+
+        with patch(
+            "ha_entsoe.get_net_position",
+            side_effect=EntsoeNotFound("404 Not Found: nothing"),
+        ):
+            with pytest.raises(SystemExit) as exc_info:
+                ha_entsoe.main(["netpos", "2023-10-28"])
+
+        assert exc_info.value.code == 1
+        assert json.loads(capsys.readouterr().err)["error"]["status"] == 404
+
+    def test_empty_rows_short_circuit(self, capsys):
+        """Empty datasets are written without going through the encoder"""
+        import json
+
+        with patch("ha_entsoe.get_scheduled_exchanges", return_value=[]):
+            ha_entsoe.main(["exchanges", "2023-10-28", "10YNL----------L", 'B"E'])
+
+        out = capsys.readouterr().out
+        assert json.loads(out) == {
+            "date": "2023-10-28",
+            "from_zone": "10YNL----------L",
+            "to_zone": 'B"E',
+            "scheduled_exchanges": [],
+        }
+        assert "\n" not in out.rstrip("\n")